@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark for all tasks on generated instances
+
+Each task is timed in stages (load = read the instance back from xlsx, load_cached = read it again from 
+the data cache, build, solve, extract) for every size in the ladder, and the results are written to JSON. With --backends the LP tasks are run once per 
+solver backend and the fastest backend at each size is reported. With --baseline the run fails (exit code 1) 
+when a stage is more than --threshold slower than in the baseline results.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --tasks lp_task1 cp_task3 --sizes 1 2 4 8 --baseline bench.json --threshold 0.25
+    python benchmark.py --tasks lp_task1 --sizes 4 16 64 --backends GLOP PDLP CLP
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import pandas as pd
+from ortools.sat.python import cp_model
+
+import generators
+import data_io
+import linear_programming as lp
+import constraint_programming as cp
+
+SIZES = [1, 2, 4]
+MIN_SECONDS = 0.01          # Stages faster than this in both runs are not checked for regressions
+
+
+
+def roundtrip_xlsx(d, directory):
+    """
+    Write generated sheets to xlsx, returns a function reading them back the way main() does (through 
+    a data cache in directory)
+    """
+    
+    path = os.path.join(directory, 'instance.xlsx')
+    with pd.ExcelWriter(path) as writer:
+        for name, df in d.items():
+            df.to_excel(writer, sheet_name=name)
+    return lambda: data_io.read_sheets(path, cache_dir=os.path.join(directory, 'data_cache'))
+
+
+class StageTimer():
+    """
+    Times stages of one benchmark run, stdout of the task code is discarded. solved_ is cleared by the 
+    solve stages of runs that end without an optimal solution.
+    """
+    
+    def __init__(self):
+        self.times_ = {}
+        self.solved_ = True
+    
+    def run(self, stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args, **kwargs)
+        self.times_[stage] = self.times_.get(stage, 0.0) + time.perf_counter() - start
+        return result
+
+
+def bench_lp_task1(size, seed, timer, directory, **solver_options):
+    params = dict(suppliers=5*size, materials=4*size, factories=3*size, products=4*size, customers=4*size)
+    load = roundtrip_xlsx(generators.supply_chain(seed=seed, **params), directory)
+    timer.run('load', load)
+    d = timer.run('load_cached', load)
+    model = timer.run('build', lp.SupplyChainModel, d, **solver_options)
+    status = timer.run('solve', model.solve, True)
+    timer.solved_ = status == lp.pywraplp.Solver.OPTIMAL
+    if timer.solved_:
+        timer.run('extract', lp.supply_chain_reports, model)
+    return params
+
+
+def bench_lp_task2(size, seed, timer, directory, **solver_options):
+    params = dict(n=6 + 4*size)
+    load = roundtrip_xlsx(generators.towns(seed=seed, **params), directory)
+    timer.run('load', load)
+    d = timer.run('load_cached', load)
+    towns = list(d['Distances'].columns)
+    # task2 builds, solves and prints the route in one go
+    status = timer.run('solve', lp.task2, d, formulation='lazy', towns_to_visit=towns, starting_town=towns[0], **solver_options)
+    timer.solved_ = status == lp.pywraplp.Solver.OPTIMAL
+    return params
+
+
+def bench_lp_task3(size, seed, timer, directory, **solver_options):
+    params = dict(lines=2 + 2*size, stops_per_line=5 + size, loop_lines=1)
+    load = roundtrip_xlsx(generators.rail(seed=seed, **params), directory)
+    timer.run('load', load)
+    d = timer.run('load_cached', load)
+    lines = d['Trains'].index.values
+    stations = d['Passengers'].columns.values
+    adjacency = timer.run('build', lp.build_station_adjacency, d['Stops'], d['Distances'], lines, 
+                          lp.loop_lines_of(d['Trains']))
+    timer.run('solve', lp.shortest_routes_dijkstra, adjacency, d['Distances'], stations)
+    # Whole task including the train MIP and printing every route
+    status = timer.run('task', lp.task3, d, **solver_options)
+    timer.solved_ = status == lp.pywraplp.Solver.OPTIMAL
+    return params
+
+
+def bench_cp_task1(size, seed, timer, directory):
+    params = dict(people=4*size, categories=4, clues=6*size*4)
+    puzzle = generators.logic_puzzle(seed=seed, **params)
+    path = os.path.join(directory, 'puzzle.json')
+    with open(path, 'w') as f:
+        json.dump(puzzle, f)
+    puzzle = timer.run('load', cp.load_puzzle, path)
+    cp.compiled_puzzles.clear()
+    timer.run('build', cp.compile_puzzle, puzzle)
+    result = timer.run('solve', cp.solve_puzzle, puzzle)   # Compiled model comes from the cache
+    timer.solved_ = result['solution'] is not None
+    return params
+
+
+def bench_cp_task2(size, seed, timer, directory):
+    params = dict(box=2 + size.bit_length(), count=max(1, 20 // size**2))
+    puzzles = generators.soduku(seed=seed, **params)
+    model, field = timer.run('build', cp.build_soduku_model, puzzles[0])
+    solver = cp_model.CpSolver()
+    status = timer.run('solve', solver.Solve, model)
+    timer.solved_ = status == cp_model.OPTIMAL
+    if timer.solved_:
+        timer.run('extract', lambda: [[solver.Value(v) for v in row] for row in field])
+    timer.run('batch', cp.solve_soduku_batch, puzzles)
+    return params
+
+
+def bench_cp_task3(size, seed, timer, directory):
+    params = dict(n_projects=9*size, months=12 + 6*(size-1), contractors=11*size, jobs=13)
+    load = roundtrip_xlsx(generators.projects(seed=seed, **params), directory)
+    timer.run('load', load)
+    d = timer.run('load_cached', load)
+    model, projs, p_c, profit_margin = timer.run('build', cp.build_task3_model, d, None)
+    model.Maximize(profit_margin)
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = 60
+    status = timer.run('solve', solver.Solve, model)
+    timer.solved_ = status == cp_model.OPTIMAL
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        timer.run('extract', lambda: [k for k in p_c if solver.Value(p_c[k])])
+    return params
+
+
+TASKS = {'lp_task1': bench_lp_task1, 'lp_task2': bench_lp_task2, 'lp_task3': bench_lp_task3, 
+         'cp_task1': bench_cp_task1, 'cp_task2': bench_cp_task2, 'cp_task3': bench_cp_task3}
+
+# Stage the solver backend is compared on, and whether the task needs a MIP backend
+BACKEND_STAGES = {'lp_task1': ('solve', False), 'lp_task2': ('solve', True), 'lp_task3': ('task', True)}
+
+
+
+def run_benchmark(tasks=None, sizes=SIZES, seed=0, backends=None, time_limit=None):
+    """
+    Time every stage of each task at each size
+
+    Parameters
+    ----------
+    tasks : LIST, optional
+        Task names (keys of TASKS). The default is None (all tasks).
+    sizes : LIST, optional
+        Size ladder, 1 is roughly the size of the xlsx data files. The default is SIZES.
+    seed : INT, optional
+        Seed for the generators. The default is 0.
+    backends : LIST, optional
+        Run each LP task with each of these solver backends (MIP tasks skip LP-only backends). The default 
+        is None (task defaults).
+    time_limit : FLOAT, optional
+        Seconds per solve for the backend runs. The default is None.
+
+    Returns
+    -------
+    results : LIST
+        One DICT per task, size, backend and stage with params, seconds and whether the run was solved.
+
+    """
+    
+    results = []
+    for task in tasks or TASKS:
+        task_backends = [None]
+        if backends and task in BACKEND_STAGES:
+            task_backends = [b for b in backends if lp.LP_BACKENDS[b] or not BACKEND_STAGES[task][1]]
+        for size in sizes:
+            for backend in task_backends:
+                timer = StageTimer()
+                solver_options = {} if backend is None else {'backend': backend, 'time_limit': time_limit}
+                with tempfile.TemporaryDirectory() as directory:
+                    params = TASKS[task](size, seed, timer, directory, **solver_options)
+                for stage, seconds in timer.times_.items():
+                    results.append({'task': task, 'size': size, 'params': params, 'backend': backend, 'stage': stage, 
+                                    'seconds': seconds, 'solved': timer.solved_})
+                    print('{:<10} size {:<3} {:<7} {:<12} {:>10.4f}s'.format(task, size, backend or '', stage, seconds))
+    return results
+
+
+def fastest_backends(results):
+    """
+    Fastest backend of each LP task at each size, compared on the task's BACKEND_STAGES stage. Runs 
+    without an optimal solution (e.g. stopped by the time limit) are left out.
+
+    Returns
+    -------
+    fastest : LIST
+        (task, size, backend, seconds).
+
+    """
+    
+    best = {}
+    for r in results:
+        if r.get('backend') is None or not r.get('solved', True) or r['stage'] != BACKEND_STAGES[r['task']][0]:
+            continue
+        key = (r['task'], r['size'])
+        if key not in best or r['seconds'] < best[key][1]:
+            best[key] = (r['backend'], r['seconds'])
+    return [(task, size, backend, seconds) for (task, size), (backend, seconds) in best.items()]
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Stages more than threshold (fraction) slower than the same task, size and stage in baseline
+
+    Returns
+    -------
+    regressions : LIST
+        (task, size, stage, baseline seconds, seconds).
+
+    """
+    
+    before = {(r['task'], r['size'], r.get('backend'), r['stage']): r['seconds'] for r in baseline}
+    regressions = []
+    for r in results:
+        old = before.get((r['task'], r['size'], r.get('backend'), r['stage']))
+        if old is None or max(old, r['seconds']) < MIN_SECONDS:
+            continue
+        if r['seconds'] > old * (1 + threshold):
+            regressions.append((r['task'], r['size'], r['stage'], old, r['seconds']))
+    return regressions
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scaling benchmark for the LP and CP-SAT tasks')
+    parser.add_argument('--tasks', nargs='+', choices=list(TASKS), help='tasks to run (default all)')
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='size ladder')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown against baseline (fraction)')
+    parser.add_argument('--backends', nargs='+', type=str.upper, choices=list(lp.LP_BACKENDS), 
+                        help='compare these solver backends on the LP tasks')
+    parser.add_argument('--time-limit', type=float, default=60, help='seconds per solve for the backend runs')
+    args = parser.parse_args(argv)
+    
+    results = run_benchmark(args.tasks, args.sizes, args.seed, args.backends, args.time_limit)
+    fastest = fastest_backends(results)
+    for task, size, backend, seconds in fastest:
+        print('FASTEST {} size {}: {} ({:.4f}s)'.format(task, size, backend, seconds))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'seed': args.seed, 'sizes': args.sizes, 'backends': args.backends, 'results': results, 
+                       'fastest': fastest}, f, indent=1)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = find_regressions(results, baseline, args.threshold)
+        for task, size, stage, old, new in regressions:
+            print('REGRESSION {} size {} {}: {:.4f}s -> {:.4f}s'.format(task, size, stage, old, new))
+        if regressions:
+            return 1
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Command line entry point running a single task
+
+Only the module of the selected task is imported (linear_programming with pywraplp, or 
+constraint_programming with CP-SAT), and only the sheets the task needs are read.
+
+    python -m cli lp task1 --data lp_1_data.xlsx --output task1.txt
+    python -m cli lp task3 --data lp_3_data.xlsx --route-engine floyd_warshall --trace trace.jsonl
+    python -m cli lp task1 --data big_supply_chain.xlsx --backend pdlp --threads 8 --time-limit 600
+    python -m cli cp task2 --data soduku.csv --max-solutions 2
+    python -m cli cp task3 --optimize --top-k 3 --workers 8 --time-limit 60
+"""
+
+import sys
+import argparse
+import contextlib
+
+# Same as linear_programming.LP_BACKENDS (True = solves MIPs), repeated so that parsing arguments doesn't import the solvers
+LP_BACKENDS = {'GLOP': False, 'PDLP': False, 'CLP': False, 'CBC': True, 'SCIP': True, 'CP_SAT': True}
+
+# LP tasks whose models have integer variables
+MIP_TASKS = ['task2', 'task3']
+
+# Input of each task when --data is not given
+DEFAULT_DATA = {('lp', 'task1'): 'lp_1_data.xlsx', ('lp', 'task2'): 'lp_2_data.xlsx', 
+                ('lp', 'task3'): 'lp_3_data.xlsx', ('cp', 'task3'): 'cp_sat_data.xlsx'}
+
+
+
+def model_cache(args):
+    if args.no_cache:
+        return None
+    from model_cache import ModelCache
+    return ModelCache()
+
+
+def read_task_data(args, sheets):
+    from data_io import read_sheets
+    return read_sheets(args.data or DEFAULT_DATA[(args.module, args.task)], sheets)
+
+
+def read_soduku(path):
+    """
+    Soduku grid from a CSV or whitespace separated text file, 0 = value to be solved
+    """
+    
+    import numpy as np
+    return np.loadtxt(path, delimiter=',' if path.lower().endswith('.csv') else None, dtype=int, ndmin=2)
+
+
+
+def run_lp(args):
+    import linear_programming as lp
+    
+    d = read_task_data(args, lp.TASK_SHEETS[args.task])
+    solver_options = {'threads': args.threads, 'time_limit': args.time_limit}
+    if args.backend is not None:
+        solver_options['backend'] = args.backend
+    if args.task == 'task1':
+        lp.task1(d, cache=model_cache(args), **solver_options)
+    elif args.task == 'task2':
+        lp.task2(d, formulation=args.formulation, towns_to_visit=args.towns, starting_town=args.start, **solver_options)
+    else:
+        lp.task3(d, route_engine=args.route_engine, workers=args.workers, **solver_options)
+
+
+def run_cp(args):
+    import constraint_programming as cp
+    
+    if args.task == 'task1':
+        cp.task1(output=args.solutions, config=args.config, encoding=args.encoding)
+    elif args.task == 'task2':
+        soduku = cp.EXAMPLE_SODUKU if args.data is None else read_soduku(args.data)
+        cp.task2(soduku, encoding=args.encoding, max_solutions=args.max_solutions, output=args.solutions)
+    else:
+        d = read_task_data(args, cp.TASK_SHEETS['task3'])
+        if args.optimize:
+            cp.task3_optimize(d, profit_margin_min=args.profit_margin_min, top_k=args.top_k, workers=args.workers, 
+                              time_limit=args.time_limit, cache=model_cache(args), distinct=args.distinct)
+        else:
+            profit_margin_min = 2160 if args.profit_margin_min is None else args.profit_margin_min
+            cp.task3(d, profit_margin_min=profit_margin_min, max_solutions=args.max_solutions, output=args.solutions, 
+                     cache=model_cache(args))
+
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m cli', description='Run one LP or CP-SAT task')
+    modules = parser.add_subparsers(dest='module', required=True)
+    
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--output', help='write the printed results to this file instead of stdout')
+    common.add_argument('--trace', nargs='?', const='-', help='write per-phase trace records to this file (default stderr)')
+    
+    lp_solver = argparse.ArgumentParser(add_help=False)
+    lp_solver.add_argument('--backend', choices=list(LP_BACKENDS), type=str.upper, 
+                           help='solver backend (default GLOP for task1, CBC for task2 and task3)')
+    lp_solver.add_argument('--threads', type=int, help='solver threads')
+    lp_solver.add_argument('--time-limit', type=float, help='seconds per solve')
+    
+    lp = modules.add_parser('lp', help='linear programming tasks (pywraplp)').add_subparsers(dest='task', required=True)
+    p = lp.add_parser('task1', parents=[common, lp_solver], help='supply chain cost minimisation')
+    p.add_argument('--data', help='workbook, CSV/Parquet file or directory (default lp_1_data.xlsx)')
+    p.add_argument('--no-cache', action='store_true', help='do not use the model cache')
+    p = lp.add_parser('task2', parents=[common, lp_solver], help='shortest route visiting towns')
+    p.add_argument('--data', help='workbook, CSV/Parquet file or directory (default lp_2_data.xlsx)')
+    p.add_argument('--formulation', choices=['subsets', 'lazy', 'mtz', 'flow'], default='subsets')
+    p.add_argument('--towns', nargs='+', help='towns to visit (default the ten towns of the original problem)')
+    p.add_argument('--start', default='Cork', help='town the route starts and ends in')
+    p = lp.add_parser('task3', parents=[common, lp_solver], help='trains required on a rail network')
+    p.add_argument('--data', help='workbook, CSV/Parquet file or directory (default lp_3_data.xlsx)')
+    p.add_argument('--route-engine', choices=['dijkstra', 'floyd_warshall', 'mip'], default='dijkstra')
+    p.add_argument('--workers', type=int, default=1, help='processes for the mip route engine')
+    
+    cp = modules.add_parser('cp', help='constraint programming tasks (CP-SAT)').add_subparsers(dest='task', required=True)
+    p = cp.add_parser('task1', parents=[common], help='dinner logic puzzle')
+    p.add_argument('--config', default='dinner_puzzle.json', help='people and categories of the puzzle')
+    p.add_argument('--encoding', choices=['boolean', 'integer'], default='boolean')
+    p.add_argument('--solutions', help='write solutions to this JSONL file instead of printing them')
+    p = cp.add_parser('task2', parents=[common], help='soduku')
+    p.add_argument('--data', help='CSV or text grid, 0 = value to be solved (default the example puzzle)')
+    p.add_argument('--encoding', choices=['integer', 'boolean'], default='integer')
+    p.add_argument('--max-solutions', type=int)
+    p.add_argument('--solutions', help='write solutions to this JSONL file instead of printing them')
+    p = cp.add_parser('task3', parents=[common], help='project planning')
+    p.add_argument('--data', help='workbook, CSV/Parquet file or directory (default cp_sat_data.xlsx)')
+    p.add_argument('--profit-margin-min', type=int, help='minimum profit margin (default 2160, none with --optimize)')
+    p.add_argument('--max-solutions', type=int)
+    p.add_argument('--solutions', help='write solutions to this JSONL file instead of printing them')
+    p.add_argument('--no-cache', action='store_true', help='do not use the model cache')
+    p.add_argument('--optimize', action='store_true', help='maximise profit margin instead of enumerating plans')
+    p.add_argument('--top-k', type=int, default=1, help='number of best plans with --optimize')
+    p.add_argument('--distinct', choices=['projects', 'assignments'], default='projects', 
+                   help='what the --top-k plans differ in')
+    p.add_argument('--workers', type=int, default=8, help='CP-SAT search workers with --optimize')
+    p.add_argument('--time-limit', type=float, help='seconds per solve with --optimize')
+    return parser
+
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.module == 'lp' and args.backend is not None and args.task in MIP_TASKS and not LP_BACKENDS[args.backend]:
+        parser.error("lp {} is a MIP, backend {} only solves LPs (use one of {})".format(
+            args.task, args.backend, ', '.join(b for b in LP_BACKENDS if LP_BACKENDS[b])))
+    
+    if args.trace:
+        import instrumentation
+        instrumentation.enable(args.trace)
+    
+    run = run_lp if args.module == 'lp' else run_cp
+    if args.output is None:
+        run(args)
+    else:
+        with open(args.output, 'w') as f, contextlib.redirect_stdout(f):
+            run(args)
+    return 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,18 +5,200 @@ Created on Tue Oct 26 19:36:10 2021
 @author: quinns4
 """
 
-import pandas as pd
 from ortools.sat.python import cp_model
 import numpy as np
+import time
+from functools import lru_cache
+from math import isqrt
+from enum import Enum
+import json
+import queue
+import threading
+import hashlib
+from model_cache import ModelCache, frame_fingerprint
+from instrumentation import TaskTrace
+from data_io import read_sheets
 
-people = ['James', 'Daniel', 'Emily', 'Sophie']
-starters = ['Prawn Coctail', 'Onion Soup', 'Mushroom Tart', 'Carpaccio']
-main_courses = ['Baked Mackerel', 'Fried Chicken', 'Filet Steak', 'Vegan Pie']
-desserts = ['Apple Crumble', 'Ice Cream', 'Chocolate Cake', 'Tiramisu']
-drinks = ['Beer', 'Coke', 'White Wine', 'Red Wine']
 
 
-def task1():
+class SolutionCount(Enum):
+    NONE = 0            # Search finished, no solution
+    UNIQUE = 1          # Search finished, exactly one solution
+    MULTIPLE = 2        # At least two solutions
+    UNKNOWN = 3         # Search stopped before it could tell (time limit, or max_solutions=1)
+
+
+def solution_count(status, solutions):
+    """
+    Classify a solution enumeration as no, one or several solutions
+
+    Parameters
+    ----------
+    status : cp_model status
+        Status returned by the CP-SAT solver. OPTIMAL/INFEASIBLE mean enumeration finished.
+    solutions : INT
+        Number of solutions found by the callback.
+
+    Returns
+    -------
+    SolutionCount
+
+    """
+    
+    if solutions >= 2:
+        return SolutionCount.MULTIPLE
+    if solutions == 1 and status == cp_model.OPTIMAL:
+        return SolutionCount.UNIQUE
+    if solutions == 0 and status == cp_model.INFEASIBLE:
+        return SolutionCount.NONE
+    return SolutionCount.UNKNOWN
+
+
+
+
+class SolutionCollector(cp_model.CpSolverSolutionCallback):
+    """
+    Record raw solution values without printing. Values go to a preallocated array (values_, one row 
+    per solution, a growing list of rows if capacity is None) or, when solution_queue is given, to a 
+    bounded queue read by the consumer thread writer. Search stops if the writer has died.
+    """
+    def __init__(self, variables, capacity=1000, solution_queue=None, max_solutions=None, writer=None):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.variables_ = variables
+        self.queue_ = solution_queue
+        self.writer_ = writer
+        self.max_solutions_ = max_solutions
+        self.values_ = None
+        if solution_queue is None:
+            self.values_ = [] if capacity is None else np.zeros((capacity, len(variables)), dtype=np.int64)
+        self.solutions_ = 0
+        self.truncated_ = False
+    
+    def OnSolutionCallback(self):
+        values = [self.Value(v) for v in self.variables_]
+        if self.queue_ is not None:
+            if not put_while_alive(self.queue_, values, self.writer_):
+                self.StopSearch()
+                return
+        elif isinstance(self.values_, list):
+            self.values_.append(values)
+        elif self.solutions_ < self.values_.shape[0]:
+            self.values_[self.solutions_] = values
+        else:
+            # Buffer full
+            self.truncated_ = True
+            self.StopSearch()
+            return
+        self.solutions_ = self.solutions_ + 1
+        
+        if self.max_solutions_ is not None and self.solutions_ >= self.max_solutions_:
+            self.StopSearch()
+
+
+def put_while_alive(solution_queue, item, writer, timeout=0.1):
+    """
+    Put item on the queue, waiting while it is full as long as the consumer thread writer is alive. 
+    Returns False if the writer died.
+    """
+    
+    while True:
+        try:
+            solution_queue.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            if writer is not None and not writer.is_alive():
+                return False
+
+
+def write_solutions(f, names, solution_queue, errors):
+    """
+    Consumer thread for SolutionCollector, writes each solution as a line of JSON until None is received
+
+    Parameters
+    ----------
+    f : FILE
+        Open output file (JSONL), closed when done.
+    names : LIST
+        Name of each value in a solution.
+    solution_queue : queue.Queue
+        Solutions (lists of values) from SolutionCollector.
+    errors : LIST
+        Exception that stopped the writer is appended here.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    try:
+        with f:
+            n = 0
+            while True:
+                values = solution_queue.get()
+                if values is None:
+                    break
+                n += 1
+                row = {'solution': n}
+                row.update(zip(names, values))
+                f.write(json.dumps(row) + '\n')
+    except Exception as e:
+        errors.append(e)
+
+
+def solve_to_jsonl(model, variables, names, output, max_solutions=None, queue_size=1000):
+    """
+    Enumerate all solutions of model, streaming them to a JSONL file from a consumer thread
+
+    Parameters
+    ----------
+    model : cp_model.CpModel
+        Model to solve.
+    variables : LIST
+        Variables (or linear expressions) recorded for each solution.
+    names : LIST
+        Name of each variable in the output.
+    output : STR
+        Output file (JSONL).
+    max_solutions : INT, optional
+        Stop search after this many solutions. The default is None (all solutions).
+    queue_size : INT, optional
+        Solutions buffered between solver and writer, solver waits when full. The default is 1000.
+
+    Returns
+    -------
+    solver : cp_model.CpSolver
+        Solver, holds the last solution found.
+    status : cp_model status
+        Solver status.
+    collector : SolutionCollector
+        Collector, solutions_ is the number of solutions written.
+
+    """
+    
+    # Open here so a bad path fails before the search starts
+    f = open(output, 'w')
+    solution_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+    writer = threading.Thread(target=write_solutions, args=(f, names, solution_queue, errors))
+    writer.start()
+    
+    solver = cp_model.CpSolver()
+    solver.parameters.enumerate_all_solutions = True
+    collector = SolutionCollector(variables, solution_queue=solution_queue, max_solutions=max_solutions, writer=writer)
+    try:
+        status = solver.Solve(model, collector)
+    finally:
+        put_while_alive(solution_queue, None, writer)
+        writer.join()
+    if errors:
+        raise errors[0]
+    
+    print('Wrote {} solutions to {}'.format(collector.solutions_, output))
+    return solver, status, collector
+
+
+def task1(output=None, config='dinner_puzzle.json', encoding='boolean'):
     """
     Solve the logical puzzle below using CP-SAT model.
 
@@ -33,6 +215,15 @@ def task1():
     Who has tiramisu for dessert?
 
 
+    Parameters
+    ----------
+    output : STR, optional
+        Write solutions to this JSONL file instead of printing them. The default is None.
+    config : STR, optional
+        JSON file with people and the items of each category. The default is 'dinner_puzzle.json'.
+    encoding : STR, optional
+        'boolean' or 'integer' model, see build_assignment_model. The default is 'boolean'.
+
     Returns
     -------
     None.
@@ -47,95 +238,17 @@ def task1():
 
 
     #Part A: Identify the objects, attributes and predicates for the puzzle and create the decision variables in a CP-SAT model [1 point]
-
-    model = cp_model.CpModel()
-
-
-    #Create all unique booleans for each possible pair
-    person_starter = {}
-    for person in people:        
-        variables = {}
-        for starter in starters:    
-            variables[starter] = model.NewBoolVar(person+starter)
-        person_starter[person] = variables
-    
-    person_main_course = {}
-    for person in people:        
-        variables = {}
-        for main_course in main_courses:    
-            variables[main_course] = model.NewBoolVar(person+main_course)
-        person_main_course[person] = variables
-
-    person_dessert = {}
-    for person in people:        
-        variables = {}
-        for dessert in desserts:    
-            variables[dessert] = model.NewBoolVar(person+dessert)
-        person_dessert[person] = variables
-
-    person_drink = {}
-    for person in people:        
-        variables = {}
-        for drink in drinks:    
-            variables[drink] = model.NewBoolVar(person+drink)
-        person_drink[person] = variables
+    trace = TaskTrace('cp_task1')
+    trace.phase('build')
+    people, categories = load_dinner_config(config)
+    model, choice = build_assignment_model(people, categories, encoding)
+    person_starter = choice['Starter']
+    person_main_course = choice['Main Course']
+    person_dessert = choice['Dessert']
+    person_drink = choice['Drink']
 
 
     for person in people:
-        #At least one item per person for each course
-        variables = []
-        for starter in starters:
-            variables.append(person_starter[person][starter])
-        model.AddBoolOr(variables)
-
-        variables = []
-        for main_course in main_courses:
-            variables.append(person_main_course[person][main_course])
-        model.AddBoolOr(variables)
-
-        variables = []
-        for dessert in desserts:
-            variables.append(person_dessert[person][dessert])
-        model.AddBoolOr(variables)
-
-        variables = []
-        for drink in drinks:
-            variables.append(person_drink[person][drink])
-        model.AddBoolOr(variables)
-
-
-        #Max one item per course per person
-        for i in range(4):
-            for j in range(i+1,4):
-                model.AddBoolOr([
-                        person_starter[person][starters[i]].Not(), 
-                        person_starter[person][starters[j]].Not()])
-                model.AddBoolOr([
-                        person_main_course[person][main_courses[i]].Not(), 
-                        person_main_course[person][main_courses[j]].Not()])
-                model.AddBoolOr([
-                        person_dessert[person][desserts[i]].Not(), 
-                        person_dessert[person][desserts[j]].Not()])
-                model.AddBoolOr([
-                        person_drink[person][drinks[i]].Not(), 
-                        person_drink[person][drinks[j]].Not()])
-
-
-        #Every person has a different meal
-        for i in range(4):
-            for j in range(i+1,4):
-                for k in range(4):
-                    model.AddBoolOr([
-                            person_starter[people[i]][starters[k]].Not(), 
-                            person_starter[people[j]][starters[k]].Not()])
-                    model.AddBoolOr([person_main_course[people[i]][main_courses[k]].Not(), 
-                                    person_main_course[people[j]][main_courses[k]].Not()])
-                    model.AddBoolOr([person_dessert[people[i]][desserts[k]].Not(), 
-                                    person_dessert[people[j]][desserts[k]].Not()])
-                    model.AddBoolOr([person_drink[people[i]][drinks[k]].Not(), 
-                                    person_drink[people[j]][drinks[k]].Not()])
-
-
         #Constraints
         
         #The filet steak main course should be combined with the onion soup as starter and with the apple crumble for dessert (4).
@@ -187,61 +300,347 @@ def task1():
                       person_drink['Daniel']['Coke']]).OnlyEnforceIf(person_dessert['James']['Chocolate Cake'])
               
       
-    solver = cp_model.CpSolver()  
-    status = solver.SearchForAllSolutions(model, SolutionPrinter_task1(person_starter, person_main_course, person_dessert, person_drink))
+    trace.model(model)
+    trace.phase('solve')
+    t = time.perf_counter()
+    if output is None:
+        solver = cp_model.CpSolver()  
+        status = solver.SearchForAllSolutions(model, SolutionPrinter_task1(choice, people))
+    else:
+        variables, names = [], []
+        for category in choice:
+            for person in people:
+                for item in choice[category][person]:
+                    variables.append(choice[category][person][item])
+                    names.append(person+'_'+item)
+        solver, status, collector = solve_to_jsonl(model, variables, names, output)
+    trace.solver(solver, status, model)
     print(solver.StatusName(status))
+    print('Constraints: {}, Variables: {}, Solve Time: {:.3f}s'.format(
+        len(model.Proto().constraints), len(model.Proto().variables), time.perf_counter() - t))
 
-    for person in people:
-        if solver.Value(person_dessert[person]["Tiramisu"]):
-            print(person+' has the Tiramisu')
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        for person in people:
+            if solver.Value(person_dessert[person]["Tiramisu"]):
+                print(person+' has the Tiramisu')
+    else:
+        print('No solution, nobody has the Tiramisu')
+    trace.end()
             
 
 
+def load_dinner_config(path):
+    """
+    Read people and categories of an assignment puzzle from JSON
+
+    Parameters
+    ----------
+    path : STR
+        JSON file {"people": [...], "categories": {category: [items]}}.
+
+    Returns
+    -------
+    people : LIST
+        People (entities) in the puzzle.
+    categories : DICT
+        Items of each category, in file order.
+
+    """
+    
+    with open(path) as f:
+        config = json.load(f)
+    return config['people'], config['categories']
+
+
+def build_assignment_model(people, categories, encoding='boolean', interchangeable=None):
+    """
+    Build CP-SAT model where each person gets one item of each category and no two people share an item
+
+    Parameters
+    ----------
+    people : LIST
+        People (entities), N.
+    categories : DICT
+        Items of each category, at least N per category.
+    encoding : STR, optional
+        'boolean' - boolean per person/item, ExactlyOne per person and per item (AtMostOne if more items than people)
+        'integer' - integer item index per person, AllDifferent per category, channelled to the booleans
+        The default is 'boolean'.
+    interchangeable : LIST, optional
+        People no constraint tells apart (not named by any clue). Their items of the first category are put 
+        in increasing order to break the symmetry between them. The default is None.
+
+    Returns
+    -------
+    model : cp_model.CpModel
+        Assignment model.
+    choice : DICT
+        choice[category][person][item] is true if person has item.
+
+    """
+    
+    if encoding not in ('boolean', 'integer'):
+        raise ValueError("Unknown encoding '{}'".format(encoding))
+    
+    model = cp_model.CpModel()
+    choice = {}
+    for category, items in categories.items():
+        if len(items) < len(people):
+            raise ValueError("Category '{}' has {} items for {} people".format(category, len(items), len(people)))
+        
+        #Create boolean for each person/item pair
+        choice[category] = {}
+        for person in people:
+            choice[category][person] = {item: model.NewBoolVar(person+item) for item in items}
+            #One item per person
+            model.AddExactlyOne(choice[category][person].values())
+        
+        if encoding == 'boolean':
+            #Every person has a different item
+            for item in items:
+                literals = [choice[category][person][item] for person in people]
+                if len(items) == len(people):
+                    model.AddExactlyOne(literals)
+                else:
+                    model.AddAtMostOne(literals)
+        else:
+            #Item index per person, all different, booleans channelled to index
+            index = {}
+            for person in people:
+                index[person] = model.NewIntVar(0, len(items)-1, person+'_'+category)
+                for k, item in enumerate(items):
+                    model.Add(index[person] == k).OnlyEnforceIf(choice[category][person][item])
+                    model.Add(index[person] != k).OnlyEnforceIf(choice[category][person][item].Not())
+            model.AddAllDifferent(index.values())
+    
+    if interchangeable and categories:
+        category, items = next(iter(categories.items()))
+        index = [sum(k * choice[category][person][item] for k, item in enumerate(items)) for person in interchangeable]
+        for i1, i2 in zip(index[:-1], index[1:]):
+            model.Add(i1 < i2)
+    
+    return model, choice
+
+
+
+PUZZLE_CACHE_SIZE = 1000
+compiled_puzzles = {}       #Puzzle hash -> (model, choice), oldest first
+
+
+def load_puzzle(path):
+    """
+    Read logic-grid puzzle description from JSON or YAML (needs pyyaml)
+
+    Parameters
+    ----------
+    path : STR
+        Puzzle file (.json, .yaml or .yml), see compile_puzzle for the format.
+
+    Returns
+    -------
+    DICT
+        Puzzle description.
+
+    """
+    
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('YAML puzzles need pyyaml, use a .json file instead')
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def puzzle_hash(puzzle, encoding='boolean'):
+    """
+    Hash of puzzle description and encoding, key of compiled_puzzles
+    """
+    
+    text = json.dumps([puzzle.get('people'), puzzle.get('categories'), puzzle.get('clues', []), encoding], sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def clue_literals(choice, item_category, term, person):
+    """
+    Literals of a clue term for a person. A term is an item, a list of items (any of them), 
+    or {"who": person, "item": item or list of items}, who overriding the person the clue is applied to.
+    """
+    
+    if isinstance(term, dict):
+        person = term.get('who', person)
+        term = term['item']
+    if person is None:
+        raise ValueError("Clue term {} needs 'who'".format(term))
+    items = term if isinstance(term, list) else [term]
+    return [choice[item_category[item]][person][item] for item in items]
+
+
+def clue_people(people, terms):
+    """
+    People a clue over terms applies to, the first person named by a term or else everybody
+    """
+    
+    named = [t['who'] for t in terms if isinstance(t, dict) and 'who' in t]
+    return named[:1] or people
+
+
+def compile_puzzle(puzzle, encoding='boolean'):
+    """
+    Compile logic-grid puzzle description into a CP-SAT model. Compiled models are cached by puzzle hash.
+    
+    Clue types (terms as in clue_literals, clues without 'who' apply to every person, and in a clue where 
+    only some terms have 'who' the other terms are about the first person named):
+        {"type": "is", "who": person, "item": item}
+        {"type": "not", "who": person, "item": item}
+        {"type": "implies", "if": term, "then": term}       - if term holds then any item of then term
+        {"type": "not_both", "terms": [term, term]}         - at most one of the terms holds
+        {"type": "one_of", "who": [people], "item": item}   - exactly one of the group has item
+
+    Parameters
+    ----------
+    puzzle : DICT
+        {"people": [...], "categories": {category: [items]}, "clues": [...]}.
+    encoding : STR, optional
+        'boolean' or 'integer', see build_assignment_model. The default is 'boolean'.
+
+    Returns
+    -------
+    model : cp_model.CpModel
+        Puzzle model, shared with the cache so must not be changed.
+    choice : DICT
+        choice[category][person][item] is true if person has item.
+
+    """
+    
+    key = puzzle_hash(puzzle, encoding)
+    if key in compiled_puzzles:
+        return compiled_puzzles[key]
+    
+    people = puzzle['people']
+    categories = puzzle['categories']
+    model, choice = build_assignment_model(people, categories, encoding)
+    item_category = {item: category for category, items in categories.items() for item in items}
+    
+    for clue in puzzle.get('clues', []):
+        kind = clue['type']
+        if kind in ('is', 'not'):
+            for literal in clue_literals(choice, item_category, clue, None):
+                model.Add(literal == (1 if kind == 'is' else 0))
+        elif kind == 'implies':
+            for person in clue_people(people, (clue['if'], clue['then'])):
+                then = clue_literals(choice, item_category, clue['then'], person)
+                for literal in clue_literals(choice, item_category, clue['if'], person):
+                    if len(then) == 1:
+                        model.AddImplication(literal, then[0])
+                    else:
+                        model.AddBoolOr(then).OnlyEnforceIf(literal)
+        elif kind == 'not_both':
+            for person in clue_people(people, clue['terms']):
+                first, second = [clue_literals(choice, item_category, t, person) for t in clue['terms']]
+                for a in first:
+                    for b in second:
+                        model.AddBoolOr([a.Not(), b.Not()])
+        elif kind == 'one_of':
+            item = clue['item']
+            model.AddExactlyOne([choice[item_category[item]][person][item] for person in clue['who']])
+        else:
+            raise ValueError("Unknown clue type '{}'".format(kind))
+    
+    if len(compiled_puzzles) >= PUZZLE_CACHE_SIZE:
+        compiled_puzzles.pop(next(iter(compiled_puzzles)))
+    compiled_puzzles[key] = (model, choice)
+    return model, choice
+
+
+def solve_puzzle(puzzle, encoding='boolean', max_solutions=2):
+    """
+    Solve logic-grid puzzle without printing, checking it has a unique solution
+
+    Parameters
+    ----------
+    puzzle : DICT or STR
+        Puzzle description, or JSON/YAML file with one.
+    encoding : STR, optional
+        'boolean' or 'integer', see build_assignment_model. The default is 'boolean'.
+    max_solutions : INT, optional
+        Stop search after this many solutions, None counts all solutions. The default is 2.
+
+    Returns
+    -------
+    result : DICT
+        count (SolutionCount), solution ({person: [items]} of first solution, None if none) 
+        and answer (person with the question item, None if nobody has it or there is no question).
+
+    """
+    
+    if isinstance(puzzle, str):
+        puzzle = load_puzzle(puzzle)
+    model, choice = compile_puzzle(puzzle, encoding)
+    
+    keys = [(category, person, item) for category in choice for person in choice[category] for item in choice[category][person]]
+    solver = cp_model.CpSolver()
+    solver.parameters.enumerate_all_solutions = True
+    collector = SolutionCollector([choice[c][p][i] for c, p, i in keys], capacity=max_solutions, max_solutions=max_solutions)
+    status = solver.Solve(model, collector)
+    
+    result = {'count': solution_count(status, collector.solutions_), 'solution': None, 'answer': None}
+    if collector.solutions_ > 0:
+        solution = {person: [] for person in puzzle['people']}
+        for (category, person, item), value in zip(keys, collector.values_[0]):
+            if value:
+                solution[person].append(item)
+        result['solution'] = solution
+        if 'question' in puzzle:
+            holders = [p for p in solution if puzzle['question'] in solution[p]]
+            result['answer'] = holders[0] if holders else None
+    return result
+
+
+
 class SolutionPrinter_task1(cp_model.CpSolverSolutionCallback):
-    def __init__(self, starter, main_course, dessert, drink):
+    def __init__(self, choice, people):
         cp_model.CpSolverSolutionCallback.__init__(self)
-        self.starter_ = starter
-        self.main_course_ = main_course
-        self.drink_ = drink
-        self.dessert_ = dessert
+        self.choice_ = choice
+        self.people_ = people
         self.solutions_ = 0
 
     def OnSolutionCallback(self):
         self.solutions_ = self.solutions_ + 1
         print("Solution:", self.solutions_ )
         
-        for person in people:
+        for person in self.people_:
             print(" - "+person+":")
 
-            for starter in starters:
-                if (self.Value(self.starter_[person][starter])):
-                    print("    - ", starter)
-            for main_course in main_courses:
-                if (self.Value(self.main_course_[person][main_course])):
-                    print("    - ", main_course)
-            for dessert in desserts:
-                if (self.Value(self.dessert_[person][dessert])):
-                    print("    - ", dessert)
-            for drink in drinks:
-                if (self.Value(self.drink_[person][drink])):
-                    print("    - ", drink)
+            for category in self.choice_:
+                for item, variable in self.choice_[category][person].items():
+                    if (self.Value(variable)):
+                        print("    - ", item)
         print()
 
 
 
 
-def task2(soduku):    
+def task2(soduku, encoding='integer', max_solutions=None, output=None):    
     """
     Soduku solver using CP_SAT model 
 
     Parameters
     ----------
     soduku : Numpy Array
-        Soduku puzzle to be solved (0 = value to be solved).
+        Soduku puzzle to be solved (0 = value to be solved), any n^2 x n^2 size.
+    encoding : STR, optional
+        'integer' or 'boolean' (one-hot) model, see build_soduku_model. The default is 'integer'.
+    max_solutions : INT, optional
+        Stop search after this many solutions, 2 checks the puzzle is unique. The default is None (all solutions).
+    output : STR, optional
+        Write solutions to this JSONL file instead of printing them. The default is None.
 
     Returns
     -------
-    None.
+    SolutionCount
+        Whether the puzzle has no, one or several solutions.
 
     """
     
@@ -251,90 +650,365 @@ def task2(soduku):
 
     print_soduku(soduku)
     all_solutions = True
-    model = cp_model.CpModel()
-    field = []
-    
-    #Part A. Create decision variables for given soduku puzzle
-    for i in range(soduku.shape[0]):
-        row = []
-        for j in range(soduku.shape[0]):  
-            if soduku[i][j] != 0:
-                #Part B. Specify constraints in digits already given
-                row.append(model.NewIntVar(int(soduku[i][j]), int(soduku[i][j]), str(i)+"_"+str(j)))
-            else:
-                row.append(model.NewIntVar(1, 9, str(i)+"_"+str(j)))
-        #Part C1. Constraint #1 all values in row are different
-        model.AddAllDifferent(row)
-        field.append(row)
-
-    
-    #Part C2. Constraint #2 all values in column are different
-    for i in range(soduku.shape[0]):
-        col = []
-        for j in range(soduku.shape[0]):
-            col.append(field[j][i])
-        model.AddAllDifferent(col)
-
-
-    #Part C3. Constraint #3 all values in 3x3 sub-grid are different
-    for h in range(soduku.shape[0]):
-        grid = []
-        for i in [(h // 3) * 3, (h // 3) * 3 + 1, (h // 3) * 3 + 2]:
-            for j in [(h % 3) * 3, (h % 3) * 3 + 1, (h % 3) * 3 + 2]:
-                grid.append(field[i][j])
-                model.AddAllDifferent(grid)    
-                       
+    trace = TaskTrace('cp_task2')
+    trace.phase('build')
+    model, field = build_soduku_model(soduku, encoding)
+    trace.model(model)
+    trace.phase('solve')
              
     #Part D. Solf CP_SAT model and print all solutions
+    if output is not None:
+        size = soduku.shape[0]
+        names = [str(i)+"_"+str(j) for i in range(size) for j in range(size)]
+        solver, status, sp = solve_to_jsonl(model, [v for row in field for v in row], names, output, max_solutions)
+        trace.solver(solver, status, model)
+        trace.end()
+        return solution_count(status, sp.solutions_)
+    
     solver = cp_model.CpSolver()              
-    sp = SolutionPrinter_task2(soduku, field, all_solutions)  
-    status = solver.SearchForAllSolutions(model, sp)
+    solver.parameters.enumerate_all_solutions = True
+    sp = SolutionPrinter_task2(soduku, field, all_solutions, max_solutions)  
+    status = solver.Solve(model, sp)
+    trace.solver(solver, status, model)
+    trace.end()
+    count = solution_count(status, sp.solutions_)
+    if max_solutions is None:
+        print("\nThere are {} solutions".format(sp.solutions_))
+    else:
+        print("\nFound {} solutions (limit {}): {}".format(sp.solutions_, max_solutions, count.name))
+    
+    return count
+
+
+
+def build_soduku_model(soduku, encoding='integer'):
+    """
+    Build CP-SAT model for n^2 x n^2 soduku puzzle (9x9, 16x16, 25x25, ...)
+
+    Parameters
+    ----------
+    soduku : Numpy Array
+        Soduku puzzle to be solved (0 = value to be solved).
+    encoding : STR, optional
+        'integer' - one integer variable per cell, AllDifferent on every row, column and box
+        'boolean' - one boolean variable per cell and value, ExactlyOne per cell and per value in every row, column and box
+        The default is 'integer'.
+
+    Returns
+    -------
+    model : cp_model.CpModel
+        Soduku model.
+    field : LIST
+        Value of each cell (variable or linear expression), list of rows.
+
+    """
+    
+    size = soduku.shape[0]
+    box = isqrt(size)
+    if box * box != size or soduku.shape != (size, size):
+        raise ValueError("Soduku of shape {} is not n^2 x n^2".format(soduku.shape))
+    if encoding not in ('integer', 'boolean'):
+        raise ValueError("Unknown encoding '{}'".format(encoding))
+    
+    model = cp_model.CpModel()
+    rows = [[(i, j) for j in range(size)] for i in range(size)]
+    cols = [[(i, j) for i in range(size)] for j in range(size)]
+    boxes = [[((h // box) * box + k // box, (h % box) * box + k % box) for k in range(size)] for h in range(size)]
+    
+    if encoding == 'integer':
+        #Part A. Create decision variables for given soduku puzzle
+        field = []
+        for i in range(size):
+            row = []
+            for j in range(size):  
+                if soduku[i][j] != 0:
+                    #Part B. Specify constraints in digits already given
+                    row.append(model.NewIntVar(int(soduku[i][j]), int(soduku[i][j]), str(i)+"_"+str(j)))
+                else:
+                    row.append(model.NewIntVar(1, size, str(i)+"_"+str(j)))
+            field.append(row)
+        
+        #Part C. All values in each row, column and box are different
+        for unit in rows + cols + boxes:
+            model.AddAllDifferent([field[i][j] for i, j in unit])
+    
+    else:
+        #Part A. Create boolean for each cell and value
+        x = [[[model.NewBoolVar(str(i)+"_"+str(j)+"_"+str(v+1)) for v in range(size)] for j in range(size)] for i in range(size)]
+        
+        #Part B. Specify constraints in digits already given
+        for i in range(size):
+            for j in range(size):
+                if soduku[i][j] != 0:
+                    model.Add(x[i][j][int(soduku[i][j])-1] == 1)
+        
+        #Part C. Each cell has one value, each value appears once in each row, column and box
+        for i in range(size):
+            for j in range(size):
+                model.AddExactlyOne(x[i][j])
+        for unit in rows + cols + boxes:
+            for v in range(size):
+                model.AddExactlyOne([x[i][j][v] for i, j in unit])
+        
+        field = [[sum((v+1) * x[i][j][v] for v in range(size)) for j in range(size)] for i in range(size)]
+    
+    return model, field
 
 
 
     
 def print_soduku(sod):
+    width = len(str(sod.shape[0]))
     print('\nProblem Soduku')
     print('-', end='')
-    print('-'*4*sod.shape[0])
+    print('-'*(3+width)*sod.shape[0])
     for i in range(sod.shape[0]):
         line = '|'
         for j in range(sod.shape[0]):
-            line += ' ' + str(sod[i][j]) + ' '
+            line += ' ' + str(sod[i][j]).rjust(width) + ' '
             line += '|'
         print(line)
         print('-', end='')
-        print('-'*4*sod.shape[0])
+        print('-'*(3+width)*sod.shape[0])
     
     
 
 class SolutionPrinter_task2(cp_model.CpSolverSolutionCallback):
-    def __init__(self, sod, field, solutions):
+    def __init__(self, sod, field, solutions, max_solutions=None):
         cp_model.CpSolverSolutionCallback.__init__(self)
         self.sod_ = sod
         self.field_ = field
         self.all_solutions_ = solutions
+        self.max_solutions_ = max_solutions
         self.solutions_ = 0
         
 
     def OnSolutionCallback(self):
         self.solutions_ = self.solutions_ + 1
+        width = len(str(self.sod_.shape[0]))
         print("\nSolution: ", self.solutions_ )
         print('-', end='')
-        print('-'*4*self.sod_.shape[0])
+        print('-'*(3+width)*self.sod_.shape[0])
         
         for i in range(self.sod_.shape[0]):
             line = '|'
             for j in range(self.sod_.shape[0]):
-                line += ' ' + str(self.Value(self.field_[i][j])) + ' '
+                line += ' ' + str(self.Value(self.field_[i][j])).rjust(width) + ' '
                 line += '|'
             print(line)
             print('-', end='')
-            print('-'*4*self.sod_.shape[0])
+            print('-'*(3+width)*self.sod_.shape[0])
+        
+        if self.max_solutions_ is not None and self.solutions_ >= self.max_solutions_:
+            self.StopSearch()
+
+
+@lru_cache(maxsize=None)
+def soduku_layout(size):
+    """
+    Row, column and box of every cell of a size x size soduku, cells numbered row by row
+
+    Returns
+    -------
+    cell_units : LIST
+        (row, column, box) of each cell.
+    units : LIST
+        Cells in each row, column and box.
+
+    """
+    
+    box = isqrt(size)
+    cell_units = []
+    units = [[] for u in range(3*size)]
+    for i in range(size*size):
+        r, c = i // size, i % size
+        b = (r // box) * box + c // box
+        cell_units.append((r, c, b))
+        units[r].append(i)
+        units[size + c].append(i)
+        units[2*size + b].append(i)
+    return cell_units, units
+
+
+def solve_soduku_bitmask(soduku, max_solutions=2, node_limit=2000):
+    """
+    Solve soduku with bitmask candidate sets. Values used in each row, column and box are kept as bitmasks, 
+    cells with one candidate and values with one possible cell in a row, column or box are filled in, and 
+    the cell with fewest candidates is branched on when nothing else can be filled in.
+
+    Parameters
+    ----------
+    soduku : Numpy Array
+        Soduku puzzle to be solved (0 = value to be solved).
+    max_solutions : INT, optional
+        Stop after this many solutions. The default is 2.
+    node_limit : INT, optional
+        Give up after this many search nodes. The default is 2000.
+
+    Returns
+    -------
+    solution : Numpy Array
+        First solution found, None if there is none.
+    solutions : INT
+        Number of solutions found (up to max_solutions), -1 if the node limit was reached first.
+
+    """
+    
+    size = soduku.shape[0]
+    cell_units, units = soduku_layout(size)
+    full = (1 << size) - 1
+    
+    cells = [int(v) for v in soduku.ravel()]
+    used = [0] * (3*size)                   # Values used in each row, column and box (bit v-1 = value v)
+    for i, v in enumerate(cells):
+        if v == 0:
+            continue
+        bit = 1 << (v-1)
+        r, c, b = cell_units[i]
+        if (used[r] | used[size+c] | used[2*size+b]) & bit:
+            return None, 0                  # Clues clash
+        used[r] |= bit
+        used[size+c] |= bit
+        used[2*size+b] |= bit
+    
+    found = []
+    nodes = [0]
+    
+    def place(cells, used, i, bit):
+        r, c, b = cell_units[i]
+        cells[i] = bit.bit_length()
+        used[r] |= bit
+        used[size+c] |= bit
+        used[2*size+b] |= bit
+    
+    def search(cells, used):
+        nodes[0] += 1
+        if nodes[0] > node_limit:
+            return False
+        
+        # Fill in cells with one candidate and values with one possible cell until nothing changes
+        while True:
+            progress = False
+            best, best_candidates, best_count = -1, 0, size+1
+            for i in range(size*size):
+                if cells[i]:
+                    continue
+                r, c, b = cell_units[i]
+                cand = full & ~(used[r] | used[size+c] | used[2*size+b])
+                if cand == 0:
+                    return True             # Dead end
+                if (cand & (cand-1)) == 0:
+                    place(cells, used, i, cand)
+                    progress = True
+                    continue
+                count = cand.bit_count()
+                if count < best_count:
+                    best, best_candidates, best_count = i, cand, count
+            if progress:
+                continue
+            
+            for u, unit in enumerate(units):
+                once, twice = 0, 0
+                candidates = {}
+                for i in unit:
+                    if cells[i]:
+                        continue
+                    r, c, b = cell_units[i]
+                    cand = full & ~(used[r] | used[size+c] | used[2*size+b])
+                    candidates[i] = cand
+                    twice |= once & cand
+                    once |= cand
+                if (once | used[u]) != full:
+                    return True             # Value can't go anywhere in this unit
+                only = once & ~twice
+                if only == 0:
+                    continue
+                for i in unit:
+                    cand = candidates.get(i, 0) & only
+                    if cand:
+                        if cand & (cand-1):
+                            return True     # Cell is the only place for two values
+                        place(cells, used, i, cand)
+                        progress = True
+            if not progress:
+                break
+        
+        if best < 0 or all(cells):
+            found.append(list(cells))
+            return True
+        
+        # Branch on cell with fewest candidates
+        cand = best_candidates
+        while cand:
+            bit = cand & -cand
+            cand ^= bit
+            branch_cells, branch_used = list(cells), list(used)
+            place(branch_cells, branch_used, best, bit)
+            if not search(branch_cells, branch_used):
+                return False
+            if len(found) >= max_solutions:
+                return True
+        return True
+    
+    if not search(cells, used):
+        return None, -1
+    if len(found) == 0:
+        return None, 0
+    return np.array(found[0]).reshape(soduku.shape), len(found)
+
+
+def solve_soduku_batch(sodukus, max_solutions=2, node_limit=2000):
+    """
+    Solve a batch of soduku puzzles. Puzzles are solved with the bitmask engine, only those it can't 
+    finish within node_limit search nodes are solved with CP-SAT.
+
+    Parameters
+    ----------
+    sodukus : Numpy Array
+        Puzzles to be solved, shape (N, size, size) (0 = value to be solved).
+    max_solutions : INT, optional
+        Stop counting solutions of a puzzle at this many (2 is enough to tell unique puzzles). The default is 2.
+    node_limit : INT, optional
+        Search nodes of the bitmask engine before a puzzle is handed to CP-SAT. The default is 2000.
 
+    Returns
+    -------
+    solutions : Numpy Array
+        First solution of each puzzle, shape (N, size, size), all 0 if a puzzle has no solution.
+    counts : Numpy Array
+        Number of solutions of each puzzle, up to max_solutions.
+
+    """
+    
+    start = time.perf_counter()
+    solutions = np.zeros(sodukus.shape, dtype=int)
+    counts = np.zeros(sodukus.shape[0], dtype=int)
+    hard = 0
+    
+    for k in range(sodukus.shape[0]):
+        solution, count = solve_soduku_bitmask(sodukus[k], max_solutions, node_limit)
+        if count < 0:
+            # Hard puzzle, solve with CP-SAT
+            hard += 1
+            model, field = build_soduku_model(sodukus[k])
+            solver = cp_model.CpSolver()
+            solver.parameters.enumerate_all_solutions = True
+            collector = SolutionCollector([v for row in field for v in row], capacity=max_solutions, max_solutions=max_solutions)
+            solver.Solve(model, collector)
+            count = collector.solutions_
+            solution = None if count == 0 else collector.values_[0].reshape(sodukus[k].shape)
+        if solution is not None:
+            solutions[k] = solution
+        counts[k] = count
+    
+    elapsed = time.perf_counter() - start
+    print('Solved {} puzzles in {:.3f}s ({:.0f} puzzles/s), {} solved with CP-SAT'.format(
+        sodukus.shape[0], elapsed, sodukus.shape[0] / max(elapsed, 1e-9), hard))
+    
+    return solutions, counts
 
 
-def task3(d, profit_margin_min = 2160):
+def task3(d, profit_margin_min = 2160, max_solutions = None, output = None, cache = None):
     """
     Project plannign using CP-SAT solver
 
@@ -344,10 +1018,17 @@ def task3(d, profit_margin_min = 2160):
         4 seperate sheets (Project, Quotes, Dependancies, Value).
     profit_margin_min : INT, optional
         Minimum profit margin. The default is 2160.
+    max_solutions : INT, optional
+        Stop search after this many solutions, 2 checks the plan is unique. The default is None (all solutions).
+    output : STR, optional
+        Write solutions to this JSONL file instead of printing them. The default is None.
+    cache : ModelCache, optional
+        Re-use model built on an earlier run with the same data. The default is None.
 
     Returns
     -------
-    None.
+    SolutionCount
+        Whether there are no, one or several plans.
 
     """
     
@@ -358,11 +1039,84 @@ def task3(d, profit_margin_min = 2160):
     
     all_solutions = False
     
+    trace = TaskTrace('cp_task3')
+    trace.phase('build')
+    model, projs, p_c, profit_margin, key = cached_task3_model(d, profit_margin_min, cache)
+    trace.model(model)
+    trace.phase('solve')
+    
+    
+    #Part H. Solve CP_SAT model    
+    if output is not None:
+        variables = list(projs.values()) + list(p_c.values()) + [profit_margin]
+        names = list(projs.keys()) + ['_'.join(k) for k in p_c.keys()] + ['profit_margin']
+        solver, status, sp = solve_to_jsonl(model, variables, names, output, max_solutions)
+        trace.solver(solver, status, model)
+        trace.end()
+        if cache is not None and sp.solutions_ > 0:
+            cache.store_solution('cp_task3', key, list(solver.ResponseProto().solution))
+        return solution_count(status, sp.solutions_)
+    
+    solver = cp_model.CpSolver()    
+    # status = solver.Solve(model)
+    # print(solver.StatusName(status))
+    solver.parameters.enumerate_all_solutions = True
+    sp = SolutionPrinter_task3(projs, p_c, profit_margin, all_solutions, max_solutions)  
+    status = solver.Solve(model, sp)
+    trace.solver(solver, status, model)
+    trace.end()
+    count = solution_count(status, sp.solutions_)
+    if cache is not None and sp.solutions_ > 0:
+        cache.store_solution('cp_task3', key, list(solver.ResponseProto().solution))
+    if max_solutions is None:
+        print("\nThere are {} solutions".format(sp.solutions_))
+    else:
+        print("\nFound {} solutions (limit {}): {}".format(sp.solutions_, max_solutions, count.name))
+    
+    return count
+     
+
+
+def build_task3_model(d, profit_margin_min = 2160, busy = None):
+    """
+    Build CP-SAT model for project planning
+
+    Parameters
+    ----------
+    d : PD DATAFRAME
+        4 seperate sheets (Project, Quotes, Dependancies, Value).
+    profit_margin_min : INT, optional
+        Minimum profit margin, None for no minimum. The default is 2160.
+    busy : SET, optional
+        (contractor, month) pairs already committed elsewhere, no assignments are created for them. The default is None.
+
+    Returns
+    -------
+    model : cp_model.CpModel
+        Project planning model.
+    projs : DICT
+        Decision variable for each project.
+    p_c : DICT
+        Decision variable for each feasible assignment, keyed (project, contractor, month, job).
+    profit_margin : cp_model.LinearExpr
+        Value of delivered projects minus contractor costs.
+
+    """
+    
     #Part A. Load data
     projects = d['Projects']
     quotes = d['Quotes']
     dependencies = d['Dependencies']
-    value = d['Value']
+    
+    contractors = quotes.index.values
+    jobs = quotes.columns.values
+    months = projects.columns.values
+    
+    #Job on each project/month as index into jobs (-1 = no job)
+    job_month = np.full(projects.shape, -1)
+    for k, j in enumerate(jobs):
+        job_month[(projects == j).to_numpy()] = k
+    qualified = quotes.notna().to_numpy()                   #Contractor can do job
 
     model = cp_model.CpModel()
     
@@ -372,141 +1126,414 @@ def task3(d, profit_margin_min = 2160):
         projs[p] = model.NewBoolVar(p)
     
     
-    #Part B2. Create decision variables for which contractor is working on which project and when    
+    #Part B2. Create decision variables for which contractor is working on which project and when, 
+    #one for each contractor qualified for the job on a project/month, keyed (project, contractor, month, job)
+    feasible = qualified[:, np.maximum(job_month, 0)] & (job_month >= 0)        #Contractor x project x month
+    if busy:
+        contractor_pos = {c: k for k, c in enumerate(contractors)}
+        month_pos = {m: k for k, m in enumerate(months)}
+        for c, m in busy:
+            if c in contractor_pos and m in month_pos:
+                feasible[contractor_pos[c], :, month_pos[m]] = False
+    ci, pi, mi = np.nonzero(feasible)
+    ji = job_month[pi, mi]
+    order = np.lexsort((mi, pi, ji, ci))
+    ci, pi, mi, ji = ci[order], pi[order], mi[order], ji[order]
+    
     p_c = {}    #Decision variables for all project/contractor pairs
-    for c in quotes.index.values:
-        #Iterate through contractors
-        for j in quotes.columns.values:
-            #Iterate through jobs
-            if str(quotes.loc[c][j]) == 'nan':
-                #If contractor is not qualified to work job, do nothing
-                pass
-            else:
-                for p in projects.index.values:
-                    #Iterate through projects
-                    for m in projects.columns.values:
-                        #Iterate through months
-                        if str(projects.loc[p][m]) == 'nan':
-                            # If no project exists on this month, do nothing
-                            pass
-                        else:
-                            if projects.loc[p][m] == j:
-                                #If contractor is qualified to work job, and job exists on this month, create boolean var 
-                                p_c[p+'_'+c+'_'+m+'_'+j] = model.NewBoolVar(p+'_'+c+'_'+m+'_'+j) 
+    contractor_month = {}           #Assignments of each contractor in each month
+    project_month = {}              #Assignments of each job on a project
+    for c, p, m, j in zip(ci, pi, mi, ji):
+        key = (projects.index[p], contractors[c], months[m], jobs[j])
+        p_c[key] = model.NewBoolVar('_'.join(key))
+        contractor_month.setdefault((c, m), []).append(p_c[key])
+        project_month.setdefault((p, m), []).append(p_c[key])
 
 
     # Part C. Constraint #1 - Contractor cannot work on two projects at the same time
-    for c in quotes.index.values:
-        #Iterated through contractors
-        for m in projects.columns.values:
-            #Iterate through months
-            jobs_on = []        #List of jobs a contractor is qualified to do for any given month
-            for p in projects.index.values:
-                #Iterate through projects
-                for j in quotes.columns.values:
-                    #Iterate trhough jobs
-                    if str(quotes.loc[c][j]) == 'nan':
-                        #If contractor is not qualified to do job, do nothing
-                        pass
-                    else:
-                        #If contractor can do job, add to list
-                        if projects.loc[p][m] == j:
-                            jobs_on.append(p_c[p+'_'+c+'_'+m+'_'+j])  
-            
-            #Maximum of 1 job per contractor per month
-            model.Add(sum(jobs_on) <= 1)
+    for jobs_on in contractor_month.values():
+        #Maximum of 1 job per contractor per month
+        model.Add(sum(jobs_on) <= 1)
        
             
     # Part D. Constraint #2 - Only one contractor can work on an job at a time
-    for p in projects.index.values:
-        #Iterate through projects
-        for m in projects.columns.values:
-            #Iterate through months
-            if str(projects.loc[p][m]) == 'nan':
-                #If no job on, do nothing
-                pass
-            else:
-                pot_job_cont = []       #List containing all potential contractors for specific job
-                for c in quotes.index.values:
-                    #Iterate through contractors
-                    for j in quotes.columns.values:
-                        #Iterate throguh jobs
-                        if str(quotes.loc[c][j]) == 'nan':
-                            #If no job do nothing
-                            pass
-                        else:
-                            if projects.loc[p][m] == j:
-                                #If job is relevant add to list
-                                pot_job_cont.append(p_c[p+'_'+c+'_'+m+'_'+j])           
-                
-                #If project is going ahead, exactly one contractor works on job
-                model.Add(sum(pot_job_cont) == 1).OnlyEnforceIf(projs[p])
-                
-                # Part E. Constraint #3 - If project is not taken on then 0 contractors work on any of the jobs
-                model.Add(sum(pot_job_cont) == 0).OnlyEnforceIf(projs[p].Not())
+    # Part E. Constraint #3 - If project is not taken on then 0 contractors work on any of the jobs
+    for p, m in zip(*np.nonzero(job_month >= 0)):
+        pot_job_cont = project_month.get((p, m), [])       #List containing all potential contractors for specific job
+        model.Add(cp_model.LinearExpr.Sum(pot_job_cont) == projs[projects.index[p]])
     
             
     # Part F. Constraint #4 - Dependencies & conlicts
-    for p1 in dependencies.index.values:
-        for p2 in dependencies.columns.values:
-            if str(dependencies.loc[p1][p2]) == 'required':
-                #If dependancie is required. Project p1 and p2 must be completed IF project p1 is going ahead
-                model.AddBoolAnd([projs[p2]]).OnlyEnforceIf(projs[p1])
-            if str(dependencies.loc[p1][p2]) == 'conflict':
-                model.AddBoolAnd([projs[p2].Not()]).OnlyEnforceIf(projs[p1])
-                
-          
-                
+    for p1, p2 in zip(*np.nonzero((dependencies == 'required').to_numpy())):
+        #If dependancie is required. Project p1 and p2 must be completed IF project p1 is going ahead
+        model.AddBoolAnd([projs[dependencies.columns[p2]]]).OnlyEnforceIf(projs[dependencies.index[p1]])
+    for p1, p2 in zip(*np.nonzero((dependencies == 'conflict').to_numpy())):
+        model.AddBoolAnd([projs[dependencies.columns[p2]].Not()]).OnlyEnforceIf(projs[dependencies.index[p1]])
 
 
     #Part G. Difference between value of all delivered projects and costs is at least profit_margin _min
-    cost = 0
-    for p in projects.index.values:
-        #Itearte through projects
-        for m in projects.columns.values:
-            #Iterate through months
-            if str(projects.loc[p][m]) == 'nan':
-                #If no job exists, do nothing
-                pass
-            else:
-                #Cost = sum of all jobs being carried out
-                for c in quotes.index.values:
-                    #Iterate through contractors
-                    for j in quotes.columns.values:
-                        #Iterate through jobs
-                        if str(quotes.loc[c][j]) == 'nan':
-                            #If contractor not qualified to do job, do nothing
-                            pass
-                        else:
-                            if projects.loc[p][m] == j:
-                                cost += int(quotes.loc[c][j])*p_c[p+'_'+c+'_'+m+'_'+j]
-    
-    val = 0
-    #Value = sum of all projects being carried out
-    for p in value.index.values:
-        val += int(value.loc[p]['Value'])*projs[p]
-    
-    profit_margin = val - cost
-    model.Add( profit_margin >= profit_margin_min)
+    profit_margin = cp_model.LinearExpr.WeightedSum(*task3_profit_terms(d, projs, p_c))
+    if profit_margin_min is not None:
+        model.Add( profit_margin >= profit_margin_min)
     
+    return model, projs, p_c, profit_margin
+
+
+def task3_profit_terms(d, projs, p_c):
+    """
+    Variables and coefficients of the profit margin: value of each project minus cost of each assignment
+
+    Parameters
+    ----------
+    d : PD DATAFRAME
+        4 seperate sheets (Project, Quotes, Dependancies, Value).
+    projs : DICT
+        Decision variable for each project.
+    p_c : DICT
+        Decision variable for each assignment, keyed (project, contractor, month, job).
+
+    Returns
+    -------
+    variables : LIST
+        Project variables followed by assignment variables.
+    coeffs : LIST
+        Project values and negated contractor quotes.
+
+    """
     
-    #Part H. Solve CP_SAT model    
-    solver = cp_model.CpSolver()    
-    # status = solver.Solve(model)
-    # print(solver.StatusName(status))
-    sp = SolutionPrinter_task3(projs, p_c, profit_margin, all_solutions)  
-    status = solver.SearchForAllSolutions(model, sp)
-    print("\nThere are {} solutions".format(sp.solutions_))
-     
+    quote = d['Quotes'].fillna(0).astype(int)
+    value = d['Value']
+    variables = [projs[p] for p in value.index.values] + list(p_c.values())
+    coeffs = [int(v) for v in value['Value']] + [-int(quote.loc[c, j]) for _, c, _, j in p_c]
+    return variables, coeffs
+
+
+
+def cached_task3_model(d, profit_margin_min = 2160, cache = None, hint = False):
+    """
+    build_task3_model, re-using the model stored in cache when the input data hasn't changed
+
+    Parameters
+    ----------
+    d : PD DATAFRAME
+        4 seperate sheets (Project, Quotes, Dependancies, Value).
+    profit_margin_min : INT, optional
+        Minimum profit margin, None for no minimum. The default is 2160.
+    cache : ModelCache, optional
+        Model cache, None to always build. The default is None.
+    hint : BOOL, optional
+        Add the last stored solution as a hint. The default is False.
+
+    Returns
+    -------
+    model, projs, p_c, profit_margin : 
+        As build_task3_model.
+    key : STR
+        Input fingerprint, for storing the solution with cache.store_solution.
+
+    """
+    
+    if cache is None:
+        return build_task3_model(d, profit_margin_min) + (None,)
+    
+    key = frame_fingerprint(d, profit_margin_min)
+    data, meta = cache.load('cp_task3', key)
+    if data is None:
+        model, projs, p_c, profit_margin = build_task3_model(d, profit_margin_min)
+        variables, coeffs = task3_profit_terms(d, projs, p_c)
+        meta = {'projects': {p: projs[p].Index() for p in projs},
+                'assignments': [list(k) + [p_c[k].Index()] for k in p_c],
+                'profit': {'vars': [v.Index() for v in variables], 'coeffs': coeffs}}
+        cache.store('cp_task3', key, str(model.Proto()).encode('utf-8'), meta)
+        return model, projs, p_c, profit_margin, key
+    
+    model = cp_model.CpModel()
+    model.Proto().parse_text_format(data.decode('utf-8'))
+    projs = {p: model.GetBoolVarFromProtoIndex(i) for p, i in meta['projects'].items()}
+    p_c = {tuple(a[:4]): model.GetBoolVarFromProtoIndex(a[4]) for a in meta['assignments']}
+    profit_margin = cp_model.LinearExpr.WeightedSum([model.GetIntVarFromProtoIndex(i) for i in meta['profit']['vars']], 
+                                                    meta['profit']['coeffs'])
+    if hint and meta.get('solution'):
+        for i, v in enumerate(meta['solution']):
+            model.AddHint(model.GetIntVarFromProtoIndex(i), v)
+    return model, projs, p_c, profit_margin, key
+
+
+
+def task3_optimize(d, profit_margin_min = None, top_k = 1, workers = 8, time_limit = None, hint = None, cache = None, 
+                   distinct = 'projects'):
+    """
+    Project planning using CP-SAT solver, maximising profit margin instead of enumerating all plans. 
+    The k best plans are found by re-solving with a cut excluding each plan already found.
+
+    Parameters
+    ----------
+    d : PD DATAFRAME
+        4 seperate sheets (Project, Quotes, Dependancies, Value).
+    profit_margin_min : INT, optional
+        Minimum profit margin. The default is None (no minimum).
+    top_k : INT, optional
+        Number of distinct plans to return, best first. The default is 1.
+    workers : INT, optional
+        CP-SAT search workers. The default is 8.
+    time_limit : FLOAT, optional
+        Time limit in seconds for each solve. The default is None (no limit).
+    hint : DICT, optional
+        Plan returned by an earlier call, used as a starting solution. The default is None.
+    cache : ModelCache, optional
+        Re-use model built on an earlier run with the same data, starting from its last best plan 
+        when no hint is given. The default is None.
+    distinct : STR, optional
+        'projects' - each plan takes on a different set of projects
+        'assignments' - plans only need to differ in a contractor assignment, so the same projects 
+        can come back with a contractor swapped
+        The default is 'projects'.
+
+    Returns
+    -------
+    plans : LIST
+        Plans, each a DICT with projects, assignments (project, contractor, month, job), profit and status.
+
+    """
+    
+    print('\n'+'-'*40)
+    print('Task 3 (optimise)')
+    print('-'*40+'\n')
+    
+    if distinct not in ('projects', 'assignments'):
+        raise ValueError("Unknown distinct '{}'".format(distinct))
+    
+    model, projs, p_c, profit_margin, key = cached_task3_model(d, profit_margin_min, cache, hint is None)
+    model.Maximize(profit_margin)
+    
+    if hint is not None:
+        assigned = set(hint['assignments'])
+        for p in projs:
+            model.AddHint(projs[p], p in hint['projects'])
+        for k in p_c:
+            model.AddHint(p_c[k], k in assigned)
+    
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = workers
+    if time_limit is not None:
+        solver.parameters.max_time_in_seconds = time_limit
+    
+    plans = []
+    while len(plans) < top_k:
+        status = solver.Solve(model)
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            break
+        
+        plan = {'projects': [p for p in projs if solver.Value(projs[p])],
+                'assignments': [k for k in p_c if solver.Value(p_c[k])],
+                'profit': solver.Value(profit_margin),
+                'status': solver.StatusName(status)}
+        plans.append(plan)
+        if cache is not None and len(plans) == 1:
+            cache.store_solution('cp_task3', key, list(solver.ResponseProto().solution))
+        
+        print('\n'+'-'*20)
+        print("Plan: ", len(plans), '('+plan['status']+')')
+        print('-'*20)
+        print('Projects Taken On:')
+        for p in plan['projects']:
+            print('\t- '+p)
+            for cj in plan['assignments']:
+                if cj[0] == p:
+                    print('\t\t- '+cj[3]+' was carried out in month '+cj[2]+' by '+cj[1])
+        print('\nProfit Margin: ', plan['profit'])
+        
+        # Exclude this plan (its project set or its exact assignments) and start the next solve from it
+        literals = projs if distinct == 'projects' else p_c
+        model.AddBoolOr([literals[k].Not() for k in literals if solver.Value(literals[k])] + 
+                        [literals[k] for k in literals if not solver.Value(literals[k])])
+        model.ClearHints()
+        for k in p_c:
+            model.AddHint(p_c[k], solver.Value(p_c[k]))
+    
+    return plans
+
+
+
+def required_closure(dependencies, projects, dependents=False):
+    """
+    Projects plus every project they require, directly or through other projects
+
+    Parameters
+    ----------
+    dependencies : Pandas DF
+        Dependencies sheet ('required' / 'conflict').
+    projects : SET
+        Starting projects.
+    dependents : BOOL, optional
+        Also add the projects requiring them, so the set holds every project linked by requirements. 
+        The default is False.
+
+    Returns
+    -------
+    SET
+        Closed set of projects.
+
+    """
+    
+    names = list(dict.fromkeys(list(dependencies.index) + list(dependencies.columns)))
+    required = (dependencies == 'required').reindex(index=names, columns=names, fill_value=False).to_numpy(dtype=bool)
+    if dependents:
+        required = required | required.T
+    
+    reached = np.isin(names, list(projects))
+    while True:
+        closed = reached | required[reached].any(axis=0)
+        if (closed == reached).all():
+            break
+        reached = closed
+    return set(projects) | {p for p, r in zip(names, reached) if r}
+
+
+def linked_projects(mask, rows, columns, axis):
+    """
+    Projects of rows (axis=1) or columns (axis=0) with a True entry in mask against any of the others
+    """
+    
+    rows = [p for p in rows if p in mask.index]
+    columns = [p for p in columns if p in mask.columns]
+    if not rows or not columns:
+        return []
+    hits = mask.loc[rows, columns].to_numpy(dtype=bool).any(axis=axis)
+    return [p for p, hit in zip(rows if axis == 1 else columns, hits) if hit]
+
+
+def task3_rolling(d, window = 4, overlap = 1, workers = 8, time_limit = None, compare = False):
+    """
+    Project planning over overlapping windows of months. Each window maximises profit over the 
+    projects starting in it plus every project linked to them by requirements (in either direction, 
+    so a required project is never decided without the later projects that need it), then commits 
+    the projects starting in its first window-overlap months and the projects linked to them. 
+    Contractors assigned by committed projects are unavailable to later windows. Only the projects 
+    of one window are in each model, with all their months since linked projects can start later.
+
+    Parameters
+    ----------
+    d : PD DATAFRAME
+        4 seperate sheets (Project, Quotes, Dependancies, Value).
+    window : INT, optional
+        Months in each window. The default is 4.
+    overlap : INT, optional
+        Months shared with the next window, projects starting in them are decided again. The default is 1.
+    workers : INT, optional
+        CP-SAT search workers. The default is 8.
+    time_limit : FLOAT, optional
+        Time limit in seconds for each window. The default is None (no limit).
+    compare : BOOL, optional
+        Also solve the full horizon and report the optimality gap. The default is False.
+
+    Returns
+    -------
+    plan : DICT
+        Projects, assignments (project, contractor, month, job) and profit, plus full_profit and gap if compare.
+
+    """
+    
+    print('\n'+'-'*40)
+    print('Task 3 (rolling horizon)')
+    print('-'*40+'\n')
+    
+    if overlap >= window:
+        raise ValueError("overlap ({}) must be smaller than window ({})".format(overlap, window))
+    
+    projects = d['Projects']
+    dependencies = d['Dependencies']
+    value = d['Value']
+    months = list(projects.columns.values)
+    start = projects.notna().to_numpy().argmax(axis=1)          #First month of each project
+    step = window - overlap
+    
+    decided = {}            #Project -> taken
+    assignments = []
+    busy = set()
+    
+    for s in range(0, len(months), step):
+        #Part A. Projects decided in this window, and projects it can see
+        commit = required_closure(dependencies, set(projects.index[(start >= s) & (start < s + step)]), True) - set(decided)
+        candidates = required_closure(dependencies, set(projects.index[(start >= s) & (start < s + window)]), True) - set(decided)
+        if not candidates:
+            continue
+        rows = [p for p in projects.index if p in candidates]
+        window_data = {'Projects': projects.loc[rows],
+                       'Quotes': d['Quotes'],
+                       'Dependencies': dependencies.loc[[p for p in rows if p in dependencies.index], 
+                                                        [p for p in rows if p in dependencies.columns]],
+                       'Value': value.loc[[p for p in rows if p in value.index]]}
+        
+        #Part B. Window model, contractors committed earlier are unavailable
+        t = time.perf_counter()
+        model, projs, p_c, profit_margin = build_task3_model(window_data, None, busy)
+        
+        #Part C. Dependencies on projects decided in earlier windows
+        required, conflict = dependencies == 'required', dependencies == 'conflict'
+        taken = [p for p in decided if decided[p]]
+        dropped = [p for p in decided if not decided[p]]
+        excluded = (linked_projects(required, projs, dropped, 1) + linked_projects(conflict, projs, taken, 1) + 
+                    linked_projects(conflict, taken, projs, 0))
+        for p in set(excluded):
+            model.Add(projs[p] == 0)
+        for p in linked_projects(required, taken, projs, 0):
+            model.Add(projs[p] == 1)
+        
+        model.Maximize(profit_margin)
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = workers
+        if time_limit is not None:
+            solver.parameters.max_time_in_seconds = time_limit
+        status = solver.Solve(model)
+        solved = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+        
+        #Part D. Commit projects starting in first part of window
+        for p in commit:
+            decided[p] = bool(solved and solver.Value(projs[p]))
+        for k in p_c:
+            if k[0] in commit and decided[k[0]] and solver.Value(p_c[k]):
+                assignments.append(k)
+                busy.add((k[1], k[2]))
+        
+        print('Window {}-{}: {} projects, {} committed ({} taken), {}, {:.3f}s'.format(
+            months[s], months[min(s + window, len(months)) - 1], len(candidates), len(commit),
+            sum(decided[p] for p in commit), solver.StatusName(status), time.perf_counter() - t))
+    
+    #Part E. Profit of committed plan
+    quotes = d['Quotes']
+    taken = [p for p in projects.index if decided.get(p, False)]
+    profit = sum(int(value.loc[p, 'Value']) for p in taken if p in value.index)
+    profit -= sum(int(quotes.loc[c, j]) for p, c, m, j in assignments)
+    plan = {'projects': taken, 'assignments': assignments, 'profit': profit}
+    
+    print('\nProjects Taken On: ', ', '.join(taken))
+    print('Profit Margin: ', profit)
+    
+    if compare:
+        #Part F. Optimality gap against solving the whole horizon at once
+        model, projs, p_c, profit_margin = build_task3_model(d, None)
+        model.Maximize(profit_margin)
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = workers
+        status = solver.Solve(model)
+        plan['full_profit'] = solver.Value(profit_margin)
+        plan['gap'] = (plan['full_profit'] - profit) / max(abs(plan['full_profit']), 1)
+        print('Full Horizon Profit Margin: ', plan['full_profit'], '({})'.format(solver.StatusName(status)))
+        print('Optimality Gap: {:.2%}'.format(plan['gap']))
+    
+    return plan
+
 
 
 class SolutionPrinter_task3(cp_model.CpSolverSolutionCallback):
-    def __init__(self, projects, pj, profit, solutions):
+    def __init__(self, projects, pj, profit, solutions, max_solutions=None):
         cp_model.CpSolverSolutionCallback.__init__(self)
         self.projects_ = projects
         self.pj_ = pj
         self.profit_ = profit
         self.all_solutions_ = solutions
+        self.max_solutions_ = max_solutions
         self.solutions_ = 0
         
 
@@ -521,14 +1548,14 @@ class SolutionPrinter_task3(cp_model.CpSolverSolutionCallback):
         projects = []
         for k in self.projects_.keys():
             if self.Value(self.projects_[k]):
-                projects.append(str(self.projects_[k]))
+                projects.append(k)
 
         contractor_jobs = []
 
         for k in self.pj_.keys():
             if self.Value(self.pj_[k]):
-                details=str(self.pj_[k]).split('_')
-                contractor_jobs.append(details)    
+                #Key is (project, contractor, month, job)
+                contractor_jobs.append(k)    
 
         for p in projects:
             print('\t- '+p)
@@ -538,16 +1565,19 @@ class SolutionPrinter_task3(cp_model.CpSolverSolutionCallback):
    
         print('\nProfit Margin: ', self.Value(self.profit_))
         
+        if self.max_solutions_ is not None and self.solutions_ >= self.max_solutions_:
+            self.StopSearch()
+        
         
 
    
     
 
-def main():
-    
-    data = pd.read_excel('cp_sat_data.xlsx', sheet_name = None, index_col=0)
-    
-    soduku_arr = np.array( [[0, 0, 0, 0, 0, 0, 0, 3, 0],
+# Sheets each task reads from its input
+TASK_SHEETS = {'task3': ['Projects', 'Quotes', 'Dependencies', 'Value']}
+
+# Soduku of the problem statement
+EXAMPLE_SODUKU = np.array( [[0, 0, 0, 0, 0, 0, 0, 3, 0],
                             [7, 0, 5, 0, 2, 0, 0, 0, 0],
                             [0, 9, 0, 0, 0, 0, 4, 0, 0],
                             [0, 0, 0, 0, 0, 4, 0, 0, 2],
@@ -558,9 +1588,16 @@ def main():
                             [6, 0, 0, 4, 0, 0, 0, 0, 5]])
 
 
+def main():
+    
+    trace = TaskTrace('cp_main')
+    trace.phase('load')
+    data = read_sheets('cp_sat_data.xlsx', TASK_SHEETS['task3'])
+    trace.end()
+
     task1()
-    task2(soduku_arr)
-    task3(data)
+    task2(EXAMPLE_SODUKU)
+    task3(data, cache=ModelCache())
 
 
 
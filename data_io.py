@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Reading task input sheets
+
+Workbooks are parsed once and every sheet is written to a columnar cache (Parquet with pyarrow, pickle 
+otherwise). Later reads load only the sheets a task asks for from the cache. A cache entry is valid while 
+the workbook's size and mtime are unchanged, or, if only the mtime changed, while its SHA-256 is the same. 
+CSV and Parquet files (one per sheet, or a directory of them) can be given instead of a workbook.
+
+    python data_io.py clear         - remove the cache
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import pandas as pd
+
+DATA_CACHE_DIR = '.data_cache'
+TABLE_FORMATS = ('.csv', '.parquet')
+
+
+
+def file_hash(path):
+    """
+    SHA-256 hex digest of a file
+    """
+    
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def read_table(path):
+    """
+    Read one sheet from a CSV or Parquet file, the first CSV column is the index.
+    """
+    
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return pd.read_csv(path, index_col=0)
+    if extension == '.parquet':
+        return pd.read_parquet(path)
+    raise ValueError("Unknown table format '{}'".format(extension))
+
+
+def write_table(df, path):
+    """
+    Write one sheet to the cache as Parquet if pyarrow is installed and the sheet is supported 
+    (e.g. string column names), otherwise as pickle. Returns the file name written.
+    """
+    
+    try:
+        import pyarrow                  # noqa: F401
+        df.to_parquet(path + '.parquet')
+        return os.path.basename(path) + '.parquet'
+    except (ImportError, ValueError, TypeError):
+        df.to_pickle(path + '.pkl')
+        return os.path.basename(path) + '.pkl'
+
+
+
+def cache_entry(path, cache_dir=DATA_CACHE_DIR):
+    """
+    Cache entry of a workbook, converting the workbook first if there is no valid entry
+
+    Parameters
+    ----------
+    path : STR
+        Path to the xlsx workbook.
+    cache_dir : STR, optional
+        Cache directory. The default is DATA_CACHE_DIR.
+
+    Returns
+    -------
+    directory : STR
+        Directory of the entry.
+    manifest : DICT
+        'sheets' maps sheet names to files in directory (in workbook order), plus the size, mtime and 
+        hash of the workbook the entry was made from.
+
+    """
+    
+    source = os.path.abspath(path)
+    name = os.path.splitext(os.path.basename(source))[0]
+    directory = os.path.join(cache_dir, name + '-' + hashlib.sha256(source.encode('utf-8')).hexdigest()[:16])
+    manifest_path = os.path.join(directory, 'manifest.json')
+    stat = os.stat(source)
+    
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    
+    if manifest is not None and manifest['size'] == stat.st_size:
+        if manifest['mtime'] == stat.st_mtime_ns:
+            return directory, manifest
+        # Touched but maybe not changed, only then is the workbook hashed
+        if manifest['sha256'] == file_hash(source):
+            manifest['mtime'] = stat.st_mtime_ns
+            with open(manifest_path, 'w') as f:
+                json.dump(manifest, f)
+            return directory, manifest
+    
+    # Convert the workbook, the manifest is written last so a partly written entry is never used
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    sha256 = file_hash(source)
+    sheets = {}
+    for i, (sheet, df) in enumerate(pd.read_excel(source, sheet_name=None, index_col=0).items()):
+        sheets[sheet] = write_table(df, os.path.join(directory, 'sheet{}'.format(i)))
+    manifest = {'source': source, 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': sha256, 'sheets': sheets}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    return directory, manifest
+
+
+
+def read_sheets(path, sheets=None, cache_dir=DATA_CACHE_DIR):
+    """
+    Read task input sheets, same result as pd.read_excel(path, sheet_name=None, index_col=0)
+
+    Parameters
+    ----------
+    path : STR
+        xlsx workbook (read through the cache), CSV or Parquet file (a single sheet named after the file) 
+        or a directory of CSV/Parquet files (one sheet per file).
+    sheets : LIST, optional
+        Names of the sheets to read. The default is None (all sheets).
+    cache_dir : STR, optional
+        Cache directory for workbooks, None reads the workbook directly. The default is DATA_CACHE_DIR.
+
+    Returns
+    -------
+    d : DICT
+        Sheet name -> Pandas DF.
+
+    """
+    
+    if os.path.isdir(path):
+        files = {os.path.splitext(f)[0]: os.path.join(path, f) for f in sorted(os.listdir(path)) 
+                 if os.path.splitext(f)[1].lower() in TABLE_FORMATS}
+    elif os.path.splitext(path)[1].lower() in TABLE_FORMATS:
+        files = {os.path.splitext(os.path.basename(path))[0]: path}
+    elif cache_dir is None:
+        d = pd.read_excel(path, sheet_name=sheets, index_col=0)
+        return d if sheets is None else {sheet: d[sheet] for sheet in sheets}
+    else:
+        directory, manifest = cache_entry(path, cache_dir)
+        files = {sheet: os.path.join(directory, f) for sheet, f in manifest['sheets'].items()}
+    
+    for sheet in sheets or []:
+        if sheet not in files:
+            raise ValueError("Unknown sheet '{}' in {}".format(sheet, path))
+    
+    d = {}
+    for sheet in sheets or files:
+        if files[sheet].endswith('.pkl'):
+            d[sheet] = pd.read_pickle(files[sheet])
+        else:
+            d[sheet] = read_table(files[sheet])
+    return d
+
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['clear']:
+        shutil.rmtree(DATA_CACHE_DIR, ignore_errors=True)
+    else:
+        print(__doc__)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded generators for synthetic instances of all tasks, in the same sheet layout as the xlsx data files
+"""
+
+import numpy as np
+import pandas as pd
+
+
+
+def supply_chain(suppliers=5, materials=4, factories=3, products=4, customers=4, seed=0):
+    """
+    Supply chain network in the lp_1_data.xlsx layout. Every product can be made, every material 
+    bought and there is enough stock and capacity for all demand, so the LP is feasible.
+
+    Parameters
+    ----------
+    suppliers, materials, factories, products, customers : INT, optional
+        Network size. The defaults are the size of lp_1_data.xlsx.
+    seed : INT, optional
+        Random seed. The default is 0.
+
+    Returns
+    -------
+    d : DICT
+        Pandas DF for each sheet.
+
+    """
+    
+    rng = np.random.default_rng(seed)
+    S = ['Supplier {}'.format(i+1) for i in range(suppliers)]
+    M = ['Material {}'.format(i+1) for i in range(materials)]
+    F = ['Factory {}'.format(i+1) for i in range(factories)]
+    P = ['Product {}'.format(i+1) for i in range(products)]
+    C = ['Customer {}'.format(i+1) for i in range(customers)]
+    
+    def subset_mask(rows, cols, p):
+        # Random mask with at least one entry in every column
+        mask = rng.random((rows, cols)) < p
+        mask[rng.integers(0, rows, cols), np.arange(cols)] = True
+        return mask
+    
+    stocked = subset_mask(suppliers, materials, 0.5)                 # Supplier sells material
+    required = subset_mask(materials, products, 0.4).T              # Product needs material
+    made = subset_mask(factories, products, 0.6).T                  # Product made in factory
+    demanded = subset_mask(customers, products, 0.3).T              # Customer wants product
+    
+    requirements = np.where(required, rng.integers(1, 10, required.shape), np.nan)
+    demand = np.where(demanded, rng.integers(1, 20, demanded.shape), np.nan)
+    
+    # Enough capacity for all demand in every factory making the product, enough stock for twice the need
+    total_demand = np.nansum(demand, axis=1)
+    capacity = np.where(made, total_demand[:, None], np.nan)
+    need = np.nansum(requirements * total_demand[:, None], axis=0)
+    stock = np.where(stocked, np.ceil(2 * need / stocked.sum(axis=0))[None, :], np.nan)
+    
+    d = {'Supplier stock': pd.DataFrame(stock, S, M),
+         'Raw material costs': pd.DataFrame(np.where(stocked, rng.integers(10, 250, stocked.shape), np.nan), S, M),
+         'Raw material shipping': pd.DataFrame(rng.integers(10, 300, (suppliers, factories)), S, F),
+         'Product requirements': pd.DataFrame(requirements, P, M),
+         'Production capacity': pd.DataFrame(capacity, P, F),
+         'Production cost': pd.DataFrame(np.where(made, rng.integers(20, 200, made.shape), np.nan), P, F),
+         'Customer demand': pd.DataFrame(demand, P, C),
+         'Shipping costs': pd.DataFrame(rng.integers(10, 150, (factories, customers)), F, C)}
+    return d
+
+
+def towns(n=19, seed=0):
+    """
+    Symmetric road distances between n towns placed at random, in the lp_2_data.xlsx layout.
+
+    Returns
+    -------
+    d : DICT
+        Pandas DF with Distances sheet.
+
+    """
+    
+    rng = np.random.default_rng(seed)
+    names = ['Town {}'.format(i+1) for i in range(n)]
+    xy = rng.random((n, 2)) * 500
+    distances = np.rint(np.sqrt(((xy[:, None, :] - xy[None, :, :])**2).sum(axis=2))).astype(int)
+    return {'Distances': pd.DataFrame(distances, names, names)}
+
+
+def rail(lines=4, stops_per_line=6, loop_lines=1, seed=0):
+    """
+    Rail network in the lp_3_data.xlsx layout. Each line after the first shares stations with 
+    earlier lines so the network is connected, the first loop_lines lines are loops (marked in the 
+    Loop column of the Trains sheet).
+
+    Returns
+    -------
+    d : DICT
+        Pandas DF for Stops, Distances, Passengers and Trains sheets.
+
+    """
+    
+    rng = np.random.default_rng(seed)
+    line_names = ['L{}'.format(i+1) for i in range(lines)]
+    line_stops = []
+    stations = []
+    for l in range(lines):
+        route = []
+        for k in range(stops_per_line):
+            # Start on an existing station, then join existing stations now and again
+            if stations and (k == 0 or rng.random() < 0.2):
+                free = [s for s in stations if s not in route]
+                if free:
+                    route.append(free[rng.integers(len(free))])
+                    continue
+            stations.append('S{}'.format(len(stations)+1))
+            route.append(stations[-1])
+        line_stops.append(route)
+    
+    n = len(stations)
+    pos = {s: i for i, s in enumerate(stations)}
+    stops = np.full((n, lines), np.nan)
+    distances = np.full((n, n), np.nan)
+    for l, route in enumerate(line_stops):
+        stops[[pos[s] for s in route], l] = np.arange(1, len(route)+1)
+        hops = list(zip(route[:-1], route[1:]))
+        if l < loop_lines:
+            hops.append((route[-1], route[0]))
+        for s1, s2 in hops:
+            if np.isnan(distances[pos[s1], pos[s2]]):
+                distances[pos[s1], pos[s2]] = distances[pos[s2], pos[s1]] = rng.integers(2, 10)
+    
+    passengers = rng.integers(0, 6, (n, n)) * 5.0
+    np.fill_diagonal(passengers, np.nan)
+    
+    d = {'Stops': pd.DataFrame(stops, stations, line_names),
+         'Distances': pd.DataFrame(distances, stations, stations),
+         'Passengers': pd.DataFrame(passengers, stations, stations),
+         'Trains': pd.DataFrame({'Capacity': rng.integers(3, 7, lines) * 10, 
+                                 'Loop': (np.arange(lines) < loop_lines).astype(int)}, line_names)}
+    return d
+
+
+def projects(n_projects=9, months=12, contractors=11, jobs=13, seed=0):
+    """
+    Project planning data in the cp_sat_data.xlsx layout. Projects run 2-5 consecutive months, every 
+    job has a qualified contractor and projects are worth about their cheapest cost plus a margin.
+
+    Returns
+    -------
+    d : DICT
+        Pandas DF for Projects, Quotes, Dependencies and Value sheets.
+
+    """
+    
+    rng = np.random.default_rng(seed)
+    P = ['Project {}'.format(i+1) for i in range(n_projects)]
+    Mo = ['M{}'.format(i+1) for i in range(months)]
+    C = ['Contractor {}'.format(i+1) for i in range(contractors)]
+    J = ['Job {}'.format(i+1) for i in range(jobs)]
+    
+    qualified = rng.random((contractors, jobs)) < 0.3
+    qualified[rng.integers(0, contractors, jobs), np.arange(jobs)] = True
+    quotes = np.where(qualified, rng.integers(1, 60, qualified.shape) * 5, np.nan)
+    cheapest = np.nanmin(quotes, axis=0)
+    
+    plan = np.full((n_projects, months), None, dtype=object)
+    value = np.zeros(n_projects, dtype=int)
+    for p in range(n_projects):
+        length = min(int(rng.integers(2, 6)), months)
+        start = int(rng.integers(0, months - length + 1))
+        job = rng.integers(0, jobs, length)
+        plan[p, start:start+length] = [J[j] for j in job]
+        value[p] = int(cheapest[job].sum() * rng.uniform(1.0, 1.6))
+    
+    dependencies = np.full((n_projects, n_projects), None, dtype=object)
+    for k in range(max(1, n_projects // 3)):
+        p1, p2 = rng.choice(n_projects, 2, replace=False)
+        dependencies[p1, p2] = 'required' if rng.random() < 0.5 else 'conflict'
+    
+    d = {'Projects': pd.DataFrame(plan, P, Mo),
+         'Quotes': pd.DataFrame(quotes, C, J),
+         'Dependencies': pd.DataFrame(dependencies, P, P),
+         'Value': pd.DataFrame({'Value': value}, P)}
+    return d
+
+
+def soduku(box=3, count=1, holes=0.6, seed=0):
+    """
+    Soduku puzzles made from a shuffled valid grid with a fraction of cells removed.
+
+    Parameters
+    ----------
+    box : INT, optional
+        Box size n, grids are n^2 x n^2. The default is 3.
+    count : INT, optional
+        Number of puzzles. The default is 1.
+    holes : FLOAT, optional
+        Fraction of cells set to 0. The default is 0.6.
+    seed : INT, optional
+        Random seed. The default is 0.
+
+    Returns
+    -------
+    Numpy Array
+        Puzzles, shape (count, n^2, n^2).
+
+    """
+    
+    rng = np.random.default_rng(seed)
+    size = box * box
+    r = np.arange(size)
+    base = (box * (r[:, None] % box) + r[:, None] // box + r[None, :]) % size + 1
+    
+    puzzles = np.zeros((count, size, size), dtype=int)
+    for k in range(count):
+        # Relabel digits, shuffle rows within bands and bands, same for columns
+        grid = rng.permutation(size)[base - 1] + 1
+        rows = np.concatenate([b * box + rng.permutation(box) for b in rng.permutation(box)])
+        cols = np.concatenate([b * box + rng.permutation(box) for b in rng.permutation(box)])
+        grid = grid[rows][:, cols]
+        if rng.random() < 0.5:
+            grid = grid.T
+        grid[rng.random(grid.shape) < holes] = 0
+        puzzles[k] = grid
+    return puzzles
+
+
+def logic_puzzle(people=4, categories=4, clues=20, seed=0):
+    """
+    Logic-grid puzzle for compile_puzzle. Clues are drawn at random and are all true of a hidden solution, 
+    so the puzzle has at least one solution.
+
+    Returns
+    -------
+    puzzle : DICT
+        Puzzle description, question is the last item of the last category.
+
+    """
+    
+    rng = np.random.default_rng(seed)
+    names = ['Person {}'.format(i+1) for i in range(people)]
+    cats = {'Category {}'.format(c+1): ['Item {}.{}'.format(c+1, i+1) for i in range(people)] for c in range(categories)}
+    items = list(cats.values())
+    
+    # Hidden solution, owner[c][i] = person with item i of category c
+    owner = [rng.permutation(people) for c in range(categories)]
+    has = {items[c][i]: owner[c][i] for c in range(categories) for i in range(people)}
+    
+    puzzle_clues = []
+    while len(puzzle_clues) < clues:
+        kind = rng.choice(['not', 'implies', 'not_both', 'one_of'])
+        c1, c2 = rng.choice(categories, 2, replace=categories < 2)
+        a, b = items[c1][rng.integers(people)], items[c2][rng.integers(people)]
+        if kind == 'not':
+            other = [p for p in range(people) if p != has[a]]
+            if other:
+                puzzle_clues.append({'type': 'not', 'who': names[other[rng.integers(len(other))]], 'item': a})
+        elif kind == 'implies' and c1 != c2:
+            b = [i for i in items[c2] if has[i] == has[a]][0]
+            puzzle_clues.append({'type': 'implies', 'if': a, 'then': b})
+        elif kind == 'not_both' and c1 != c2 and has[a] != has[b]:
+            puzzle_clues.append({'type': 'not_both', 'terms': [a, b]})
+        elif kind == 'one_of' and people > 2:
+            group = [has[a]] + [p for p in rng.permutation(people) if p != has[a]][:1]
+            puzzle_clues.append({'type': 'one_of', 'who': [names[p] for p in sorted(group)], 'item': a})
+    
+    return {'people': names, 'categories': cats, 'clues': puzzle_clues, 'question': items[-1][-1]}
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Per-phase instrumentation of the task functions
+
+Each task splits its work into phases (build, solve, extract, ...). For every phase a JSON line is written 
+with wall time, peak Python memory (tracemalloc), model size and solver statistics. Tracing is off unless 
+the TASK_TRACE environment variable is set (a file to append to, or - for stderr) or enable() is called, 
+and costs nothing when off.
+
+    TASK_TRACE=trace.jsonl python linear_programming.py
+"""
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+
+TRACE_ENV = 'TASK_TRACE'
+trace_output = None             # Set by enable(), overrides TRACE_ENV
+
+
+
+def enable(path='-'):
+    """
+    Turn tracing on, records are appended to path (- = stderr). enable(None) turns it off.
+    """
+    
+    global trace_output
+    trace_output = path
+
+
+def trace_target():
+    if trace_output is not None:
+        return trace_output
+    return os.environ.get(TRACE_ENV) or None
+
+
+def emit(record):
+    """
+    Write one trace record as a JSON line.
+    """
+    
+    target = trace_target()
+    if target is None:
+        return
+    line = json.dumps(record, default=str) + '\n'
+    if target == '-':
+        sys.stderr.write(line)
+    else:
+        with open(target, 'a') as f:
+            f.write(line)
+
+
+
+def model_stats(model):
+    """
+    Size of a CP-SAT model or pywraplp solver
+
+    Returns
+    -------
+    DICT
+        variables, constraints and nonzeros (variable references in linear and boolean constraints 
+        for CP-SAT, constraint matrix entries for pywraplp).
+
+    """
+    
+    if hasattr(model, 'Proto'):
+        proto = model.Proto()
+        nonzeros = 0
+        for c in proto.constraints:
+            #Reading an unset submessage of the proto wrapper would set it, so check has_ first
+            nonzeros += len(c.enforcement_literal)
+            if c.has_linear():
+                nonzeros += len(c.linear.vars)
+            for kind in ('bool_or', 'bool_and', 'exactly_one', 'at_most_one'):
+                if getattr(c, 'has_' + kind)():
+                    nonzeros += len(getattr(c, kind).literals)
+            if c.has_all_diff():
+                nonzeros += len(c.all_diff.exprs)
+        return {'variables': len(proto.variables), 'constraints': len(proto.constraints), 'nonzeros': nonzeros}
+    
+    from ortools.linear_solver import linear_solver_pb2
+    proto = linear_solver_pb2.MPModelProto()
+    model.ExportModelToProto(proto)
+    nonzeros = sum(len(c.var_index) for c in proto.constraint)
+    return {'variables': model.NumVariables(), 'constraints': model.NumConstraints(), 'nonzeros': nonzeros}
+
+
+def solver_stats(solver, status=None, wall_time=None, model=None):
+    """
+    Statistics of the last solve of a CP-SAT or pywraplp solver
+
+    Parameters
+    ----------
+    solver : cp_model.CpSolver or pywraplp.Solver
+        Solver after the solve.
+    status : INT or STR, optional
+        Status returned by the CP-SAT solve, status name for pywraplp (see linear_programming.SOLVER_STATUS). 
+        The default is None.
+    wall_time : FLOAT, optional
+        Seconds the solve took, only used for pywraplp whose own wall_time() counts from the creation 
+        of the solver. The default is None (no wall_time for pywraplp).
+    model : cp_model.CpModel, optional
+        Solved CP-SAT model, objective, bound and gap are only recorded if it has an objective. 
+        The default is None (no objective).
+
+    Returns
+    -------
+    DICT
+        status (name, same names for CP-SAT and pywraplp), wall_time (seconds), branches, conflicts or 
+        iterations/nodes, objective, bound and relative gap.
+
+    """
+    
+    if hasattr(solver, 'ResponseProto'):
+        response = solver.ResponseProto()
+        stats = {'status': solver.StatusName(status) if status is not None else solver.StatusName(),
+                 'wall_time': response.wall_time, 'branches': response.num_branches, 'conflicts': response.num_conflicts}
+        if model is not None and model.Proto().has_objective():
+            stats['objective'] = response.objective_value
+            stats['bound'] = response.best_objective_bound
+    else:
+        stats = {'status': status, 'iterations': solver.iterations()}
+        if wall_time is not None:
+            stats['wall_time'] = wall_time
+        if stats['status'] in ('OPTIMAL', 'FEASIBLE'):
+            stats['objective'] = solver.Objective().Value()
+        if solver.IsMip():
+            stats['nodes'] = solver.nodes()
+            if 'objective' in stats:
+                stats['bound'] = solver.Objective().BestBound()
+    if 'objective' in stats and 'bound' in stats:
+        stats['gap'] = abs(stats['objective'] - stats['bound']) / max(abs(stats['objective']), 1e-9)
+    return stats
+
+
+
+class TaskTrace():
+    """
+    Phases of one task run. phase(name) ends the running phase and starts the next, end() ends the last one. 
+    Does nothing unless tracing is on.
+
+    Parameters
+    ----------
+    task : STR
+        Task name written in every record.
+
+    """
+    
+    def __init__(self, task):
+        self.task_ = task
+        self.enabled_ = trace_target() is not None
+        self.record_ = None
+        self.start_ = None
+    
+    
+    def phase(self, name):
+        if not self.enabled_:
+            return
+        self.end()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.record_ = {'task': self.task_, 'phase': name, 'time': time.time()}
+        self.start_ = time.perf_counter()
+    
+    
+    def model(self, model):
+        """
+        Record size of model (CP-SAT model or pywraplp solver) in the running phase.
+        """
+        
+        if self.enabled_ and self.record_ is not None:
+            self.record_['model'] = model_stats(model)
+    
+    
+    def solver(self, solver, status=None, model=None):
+        """
+        Record statistics of solver's last solve in the running phase, model is the solved CP-SAT model. 
+        The solve time of a pywraplp solver is taken as the time since the phase started, so start the 
+        phase right before Solve().
+        """
+        
+        if self.enabled_ and self.record_ is not None:
+            self.record_['solver'] = solver_stats(solver, status, time.perf_counter() - self.start_, model)
+    
+    
+    def end(self):
+        if not self.enabled_ or self.record_ is None:
+            return
+        self.record_['wall_time'] = time.perf_counter() - self.start_
+        self.record_['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        emit(self.record_)
+        self.record_ = None
@@ -1,13 +1,22 @@
 import pandas as pd
+import numpy as np
 from ortools.linear_solver import pywraplp
+from ortools.linear_solver import linear_solver_pb2
 import copy
+import heapq
+import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from itertools import combinations
+from model_cache import ModelCache, frame_fingerprint
+from instrumentation import TaskTrace
+from data_io import read_sheets
 
 
 
-def task1(d):
+def supply_chain_arrays(d):
     """
-    Given supply chain information provided in accompanied data. Minimize the overall cost
+    Convert the supply chain sheets into NumPy arrays with a common order of suppliers, materials, factories, 
+    products and customers. Combinations that are not possible are NaN.
 
     Parameters
     ----------
@@ -16,349 +25,887 @@ def task1(d):
 
     Returns
     -------
-    None.
+    sc : DICT
+        Names of 'suppliers', 'materials', 'factories', 'products' and 'customers', and one array per sheet: 
+        'supplier_stock' [s,m], 'raw_materials' [s,m], 'raw_material_shipping' [s,f], 'product_requirements' [p,m], 
+        'production_capacity' [p,f], 'production_cost' [p,f], 'customer_demand' [p,c], 'shipping_costs' [f,c].
 
     """
     
-    print('\n'+'-'*40)
-    print('\t\t\t\tTask 1')
-    print('-'*40+'\n')
+    suppliers = d['Supplier stock'].index.values
+    materials = d['Supplier stock'].columns.values
+    factories = d['Shipping costs'].index.values
+    products = d['Customer demand'].index.values
+    customers = d['Customer demand'].columns.values
     
-    print_results = False
+    sc = {'suppliers': suppliers, 'materials': materials, 'factories': factories, 'products': products, 'customers': customers}
+    sc['supplier_stock'] = d['Supplier stock'].loc[suppliers, materials].to_numpy(dtype=float)
+    sc['raw_materials'] = d['Raw material costs'].loc[suppliers, materials].to_numpy(dtype=float)
+    sc['raw_material_shipping'] = d['Raw material shipping'].loc[suppliers, factories].to_numpy(dtype=float)
+    sc['product_requirements'] = d['Product requirements'].loc[products, materials].to_numpy(dtype=float)
+    sc['production_capacity'] = d['Production capacity'].loc[products, factories].to_numpy(dtype=float)
+    sc['production_cost'] = d['Production cost'].loc[products, factories].to_numpy(dtype=float)
+    sc['customer_demand'] = d['Customer demand'].loc[products, customers].to_numpy(dtype=float)
+    sc['shipping_costs'] = d['Shipping costs'].loc[factories, customers].to_numpy(dtype=float)
     
-    #Part A. Load data
-    supplier_stock = d['Supplier stock']
-    raw_materials = d['Raw material costs']
-    raw_material_shipping = d['Raw material shipping']
-    product_requirements = d['Product requirements']
-    production_capacity = d['Production capacity']
-    production_cost = d['Production cost']
-    customer_demand = d['Customer demand']
-    shipping_costs = d['Shipping costs']
-    
-    # Part B. Create decision variables    
-    solver = pywraplp.Solver('LPWrapper', pywraplp.Solver.GLOP_LINEAR_PROGRAMMING)
-    
-    # Part B: Decision variables
-    orders_from_supplier = {}
-    production_volume = {}
-    delivery_customers = {}
-    suppliers = supplier_stock.index.values
-    materials = supplier_stock.columns.values
-    factories = shipping_costs.index.values
-    products = customer_demand.index.values
-    customers = customer_demand.columns.values 
-
-                        
-    # Part B (i): Orders from suppliers - For each Supplier/Factory/Material combination create decision variable
-    for s in suppliers:
-        for m in materials:
-            for f in factories:
-                if not str(supplier_stock.loc[s,m]) == 'nan':
-                    orders_from_supplier[s+'_'+m+'_'+f] = solver.NumVar(0, solver.infinity(),s+'_'+m+'_'+f)
-    
-    
-    # Part B (ii): Production Volume - For each Factory/Product combination create decision variables
-    for f in factories:
-        for p in products:
-            if not str(production_capacity.loc[p,f]) == 'nan':
-               production_volume[f+'_'+p] = solver.NumVar(0, solver.infinity(), f+'_'+p)
-                        
-                    
-   # Part B (iii): Delivery to customers - For each Factory/Customer/Product combination create a decision variable                                    
-    for c in customers:
-        for p in products:
-            for f in factories:
-                if not str(production_capacity.loc[p,f]) == 'nan' and not str(customer_demand.loc[p,c]) == 'nan':
-                    delivery_customers[c+'_'+p+'_'+f] = solver.NumVar(0, solver.infinity(), c+'_'+p+'_'+f) 
-                
-                    
-    # Part C: Implement constraints that ensures factories produce more than they ship to customers                        
-    customer_requirement = customer_demand.sum(axis=1)
-    for p in products:
-        constraint = solver.Constraint(customer_requirement.loc[p],  solver.infinity())
-        for f in factories:
-            if not str(production_capacity.loc[p,f]) == 'nan':
-                constraint.SetCoefficient(production_volume[f+'_'+p], 1)
-                                
-                
-    # Part D. Implements constraints that ensure customer demands are met
-    for c in customers:
-        for p in products:
-            if not str(customer_demand.loc[p,c]) == 'nan':       
-                constraint = solver.Constraint(customer_demand.loc[p,c], solver.infinity())
-                for f in factories:
-                    if not str(production_capacity.loc[p,f]) == 'nan':
-                        constraint.SetCoefficient(delivery_customers[c+'_'+p+'_'+f], 1)
-                    
-                        
-    # Part E. Implement constraints that suppliers have all ordered items in stock
-    for s in suppliers:
-        for m in materials:
-            if not str(supplier_stock.loc[s,m])== 'nan':
-                constraint = solver.Constraint(0, supplier_stock.loc[s,m])
-                for f in factories:
-                    constraint.SetCoefficient(orders_from_supplier[s+'_'+m+'_'+f], 1)
-
-
-    
-    # Part F. Ensure factories order enough material to be able to manufacture all items     
-    material_requirements = {}
-    # First determine how much material is required accross the board to fulfil all customers demands
-    for m in materials:
-        if m not in material_requirements.keys():
-            material_requirements[m] = 0
-        for p in products:
-            if not str(product_requirements.loc[p,m]) == 'nan':
-                material_requirements[m] += customer_requirement[p]*product_requirements.loc[p,m]
-
-    
-    # Implement constraints that the material requirements are satisfied accross all factories
-    for m in materials:
-        constraint = solver.Constraint(material_requirements[m], solver.infinity())
-        for s in suppliers:
-            for f in factories:
-                if not str(supplier_stock.loc[s,m])== 'nan':
-                    for p in products:
-                        if not str(product_requirements.loc[p,m]) == 'nan' and not str(production_capacity.loc[p,f]) == 'nan':
-                            constraint.SetCoefficient(orders_from_supplier[s+'_'+m+'_'+f], 1) 
-
-    # If a factory is producing product it is also shipping it to customer
-    for f in factories:
-        for p in products:
-            if not str(production_capacity.loc[p,f]) == 'nan':
-                constraint = solver.Constraint(0,0)
-                constraint.SetCoefficient(production_volume[f+'_'+p], 1)
-                for c in customers:
-                    if not str(customer_demand.loc[p,c]) == 'nan':
-                        constraint.SetCoefficient(delivery_customers[c+'_'+p+'_'+f], -1)
-                        
-                        
-    # If a factory is producing a product it is ordering the required material
-    for f in factories:
-        for m in materials:
-            constraint = solver.Constraint(0,0)
-            for p in products:
-                if not str(production_capacity.loc[p,f]) == 'nan' and not str(product_requirements.loc[p,m]) == 'nan' :
-                    constraint.SetCoefficient(production_volume[f+'_'+p], product_requirements.loc[p,m])
-                    for s in suppliers:
-                        if not str(supplier_stock.loc[s,m]) == 'nan':
-                            constraint.SetCoefficient(orders_from_supplier[s+'_'+m+'_'+f], -1)
-
-
-    # Part G. Implement constraints that all manufacturing capacities are not exceeded
-    for f in factories:
-        for p in products:
-            if not str(production_capacity.loc[p,f]) == 'nan':
-                constraint = solver.Constraint(0, production_capacity.loc[p,f])
-                for c in customers:
-                    if not str(customer_demand.loc[p,c]) == 'nan':
-                        constraint.SetCoefficient(production_volume[f+'_'+p], 1)
-  
-   
-    
-    # Part H. Define object function - including shipping & material costs - production cost - delivery cost
-    cost = solver.Objective()
-                                                      
-    # Part H (i): Material Cost
-    for s in suppliers:
-        for m in materials:
-            for f in factories:
-                if not str(supplier_stock.loc[s,m]) == 'nan':
-                    cost.SetCoefficient(orders_from_supplier[s+'_'+m+'_'+f] , float(raw_materials.loc[s,m]))
-                    cost.SetCoefficient(orders_from_supplier[s+'_'+m+'_'+f] , float(raw_material_shipping.loc[s,f]))               
+    return sc
+
+
+# Backends by pywraplp.Solver.CreateSolver name, True for those that solve integer programs
+LP_BACKENDS = {'GLOP': False, 'PDLP': False, 'CLP': False, 'CBC': True, 'SCIP': True, 'CP_SAT': True}
+
+
+def create_solver(backend, threads=None, time_limit=None, mip=False):
+    """
+    Create a pywraplp solver for one of LP_BACKENDS
+
+    Parameters
+    ----------
+    backend : STR
+        'GLOP' (simplex), 'PDLP' (first-order, for LPs too large for simplex), 'CLP', 'CBC', 'SCIP' or 'CP_SAT'. 
+        CP_SAT has to scale continuous variables to integers and is only practical for small LPs.
+    threads : INT, optional
+        Number of threads, for backends that support it. The default is None (backend default).
+    time_limit : FLOAT, optional
+        Seconds per solve. The default is None (no limit).
+    mip : BOOL, optional
+        The model has integer variables, LP-only backends are refused. The default is False.
+
+    Returns
+    -------
+    solver : pywraplp.Solver
+        Empty solver.
+
+    """
     
-            
-    # Part H (ii): Production Cost
-    for f in factories:
-        for p in products:
-            for m in materials:
-                if not str(production_capacity.loc[p,f]) == 'nan' and not str(product_requirements.loc[p,m]) == 'nan':
-                    cost.SetCoefficient(production_volume[f+'_'+p], float(production_cost.loc[p,f]))
-                 
-                
-    # Part H (iii): Delivery to each customer cost
-    for c in customers:
-        for p in products:
-            for f in factories:
-                if not str(production_capacity.loc[p,f]) == 'nan' and not str(customer_demand.loc[p,c]) == 'nan':
-                    cost.SetCoefficient(delivery_customers[c+'_'+p+'_'+f], float(shipping_costs.loc[f,c]))
-                        
-    cost.SetMinimization()
+    backend = backend.upper()
+    if backend not in LP_BACKENDS:
+        raise ValueError("Unknown backend '{}'".format(backend))
+    if mip and not LP_BACKENDS[backend]:
+        raise ValueError("Backend '{}' can't solve integer programs".format(backend))
+    solver = pywraplp.Solver.CreateSolver(backend)
+    if solver is None:
+        raise ValueError("Backend '{}' is not available in this OR-Tools build".format(backend))
+    if threads is not None:
+        solver.SetNumThreads(threads)
+    if time_limit is not None:
+        solver.SetTimeLimit(int(time_limit * 1000))
+    return solver
+
+
+def build_supply_chain_model(sc, backend='GLOP', threads=None, time_limit=None):
+    """
+    Build the supply chain LP. The constraint matrix is put together as (row, column, coefficient) triplets 
+    from masks of the data arrays and loaded into the solver as one model.
+
+    Parameters
+    ----------
+    sc : DICT
+        Supply chain arrays from supply_chain_arrays.
+    backend, threads, time_limit : 
+        Solver the model is loaded into, see create_solver. The default is GLOP.
+
+    Returns
+    -------
+    solver : pywraplp.Solver
+        Solver holding the model.
+    index : DICT
+        Position of each decision variable in solver.variables(), -1 where the variable doesn't exist: 
+        'orders' [s,m,f], 'production' [f,p], 'delivery' [c,p,f]. Position of constraints whose bounds come 
+        from the data in solver.constraints(), -1 where the constraint doesn't exist: 'requirement_rows' [p], 
+        'demand_rows' [c,p], 'stock_rows' [s,m], 'material_rows' [m], 'capacity_rows' [f,p].
+
+    """
     
+    S, M, F, P, C = len(sc['suppliers']), len(sc['materials']), len(sc['factories']), len(sc['products']), len(sc['customers'])
+    
+    stock_mask = ~np.isnan(sc['supplier_stock'])                   # [s,m] supplier stocks material
+    requirement_mask = ~np.isnan(sc['product_requirements'])       # [p,m] product is made from material
+    capacity_mask = ~np.isnan(sc['production_capacity'])           # [p,f] factory can make product
+    demand_mask = ~np.isnan(sc['customer_demand'])                 # [p,c] customer orders product
+    requirements = np.nan_to_num(sc['product_requirements'])
+    factory_uses = (requirement_mask.T.astype(int) @ capacity_mask.astype(int)) > 0       # [m,f] factory makes a product from material
+    
+    # Part B (i-iii): Decision variables, numbered orders_from_supplier [s,m,f], production_volume [f,p], delivery_customers [c,p,f]
+    order_mask = np.broadcast_to(stock_mask[:, :, None], (S, M, F))
+    production_mask = capacity_mask.T
+    delivery_mask = demand_mask.T[:, :, None] & capacity_mask[None, :, :]
+    
+    n_orders, n_production, n_delivery = order_mask.sum(), production_mask.sum(), delivery_mask.sum()
+    orders = np.full((S, M, F), -1)
+    orders[order_mask] = np.arange(n_orders)
+    production = np.full((F, P), -1)
+    production[production_mask] = np.arange(n_production) + n_orders
+    delivery = np.full((C, P, F), -1)
+    delivery[delivery_mask] = np.arange(n_delivery) + n_orders + n_production
+    
+    names = []
+    for s, m, f in zip(*np.nonzero(order_mask)):
+        names.append(sc['suppliers'][s]+'_'+sc['materials'][m]+'_'+sc['factories'][f])
+    for f, p in zip(*np.nonzero(production_mask)):
+        names.append(sc['factories'][f]+'_'+sc['products'][p])
+    for c, p, f in zip(*np.nonzero(delivery_mask)):
+        names.append(sc['customers'][c]+'_'+sc['products'][p]+'_'+sc['factories'][f])
+    
+    rows, cols, coefs, lower, upper = [], [], [], [], []
+    
+    def add_constraints(n, row, col, coef, lb, ub):
+        # Add n constraints, row numbers are counted from the first of them
+        rows.append(row + sum(map(len, lower)))
+        cols.append(col)
+        coefs.append(np.broadcast_to(coef, np.shape(col)).astype(float))
+        lower.append(np.broadcast_to(lb, n).astype(float))
+        upper.append(np.broadcast_to(ub, n).astype(float))
+    
+    # Part C: Factories produce more than they ship to customers, one row per product
+    customer_requirement = np.nansum(sc['customer_demand'], axis=1)
+    f, p = np.nonzero(production_mask)
+    requirement_rows = np.arange(P) + sum(map(len, lower))
+    add_constraints(P, p, production[f, p], 1.0, customer_requirement, np.inf)
+    
+    # Part D: Customer demands are met, one row per customer/product ordered
+    demand_row = np.full((C, P), -1)
+    demand_row[demand_mask.T] = np.arange(demand_mask.sum())
+    c, p, f = np.nonzero(delivery_mask)
+    demand_rows = np.where(demand_row >= 0, demand_row + sum(map(len, lower)), -1)
+    add_constraints(demand_mask.sum(), demand_row[c, p], delivery[c, p, f], 1.0, sc['customer_demand'].T[demand_mask.T], np.inf)
+    
+    # Part E: Suppliers have all ordered items in stock, one row per supplier/material stocked
+    stock_row = np.full((S, M), -1)
+    stock_row[stock_mask] = np.arange(stock_mask.sum())
+    s, m, f = np.nonzero(order_mask)
+    stock_rows = np.where(stock_row >= 0, stock_row + sum(map(len, lower)), -1)
+    add_constraints(stock_mask.sum(), stock_row[s, m], orders[s, m, f], 1.0, 0.0, sc['supplier_stock'][stock_mask])
+    
+    # Part F: Material requirements are satisfied across all factories, one row per material
+    material_requirements = customer_requirement @ requirements
+    s, m, f = np.nonzero(order_mask & factory_uses[None, :, :])
+    material_rows = np.arange(M) + sum(map(len, lower))
+    add_constraints(M, m, orders[s, m, f], 1.0, material_requirements, np.inf)
+    
+    # If a factory is producing product it is also shipping it to customer, one row per factory/product
+    c, p, f = np.nonzero(delivery_mask)
+    f_p, p_p = np.nonzero(production_mask)
+    balance_row = np.full((F, P), -1)
+    balance_row[production_mask] = np.arange(n_production)
+    add_constraints(n_production, np.concatenate([balance_row[f_p, p_p], balance_row[f, p]]), 
+                    np.concatenate([production[f_p, p_p], delivery[c, p, f]]), 
+                    np.concatenate([np.ones(n_production), -np.ones(n_delivery)]), 0.0, 0.0)
+    
+    # If a factory is producing a product it is ordering the required material, one row per factory/material used
+    material_row = np.full((F, M), -1)
+    material_row[factory_uses.T] = np.arange(factory_uses.sum())
+    f_p, p_p, m_p = np.nonzero(production_mask[:, :, None] & requirement_mask[None, :, :])
+    s, m, f = np.nonzero(order_mask & factory_uses[None, :, :])
+    add_constraints(factory_uses.sum(), np.concatenate([material_row[f_p, m_p], material_row[f, m]]), 
+                    np.concatenate([production[f_p, p_p], orders[s, m, f]]), 
+                    np.concatenate([requirements[p_p, m_p], -np.ones(len(s))]), 0.0, 0.0)
+    
+    # Part G: Manufacturing capacities are not exceeded, one row per factory/product with customer demand
+    f, p = np.nonzero(production_mask & demand_mask.any(axis=1)[None, :])
+    capacity_rows = np.full((F, P), -1)
+    capacity_rows[f, p] = np.arange(len(f)) + sum(map(len, lower))
+    add_constraints(len(f), np.arange(len(f)), production[f, p], 1.0, 0.0, sc['production_capacity'][p, f])
+    
+    index = {'orders': orders, 'production': production, 'delivery': delivery, 'requirement_rows': requirement_rows, 
+             'demand_rows': demand_rows, 'stock_rows': stock_rows, 'material_rows': material_rows, 'capacity_rows': capacity_rows}
+    
+    # Part H: Objective - material & shipping cost, production cost, delivery cost
+    objective = supply_chain_objective(sc, index)
+    
+    # Load model, constraint coefficients sorted by row
+    rows, cols, coefs = np.concatenate(rows), np.concatenate(cols), np.concatenate(coefs)
+    lower, upper = np.concatenate(lower), np.concatenate(upper)
+    order = np.argsort(rows, kind='stable')
+    row_starts = np.searchsorted(rows[order], np.arange(len(lower)+1))
+    cols, coefs = cols[order].tolist(), coefs[order].tolist()
+    
+    model = linear_solver_pb2.MPModelProto()
+    for i in range(len(names)):
+        model.variable.add(lower_bound=0, upper_bound=np.inf, objective_coefficient=objective[i], name=names[i])
+    for r in range(len(lower)):
+        constraint = model.constraint.add(lower_bound=lower[r], upper_bound=upper[r])
+        constraint.var_index.extend(cols[row_starts[r]:row_starts[r+1]])
+        constraint.coefficient.extend(coefs[row_starts[r]:row_starts[r+1]])
+    
+    solver = create_solver(backend, threads, time_limit)
+    solver.LoadModelFromProtoKeepNames(model)
+    
+    return solver, index
 
-    # Part I. Solve linear program
-    solver.Solve()
-    total_cost = 0   
+
+def supply_chain_objective(sc, index):
+    """
+    Cost of one unit of each decision variable: material and shipping cost for orders from suppliers, 
+    production cost and delivery cost.
+
+    Parameters
+    ----------
+    sc : DICT
+        Supply chain arrays from supply_chain_arrays.
+    index : DICT
+        Decision variable positions from build_supply_chain_model.
+
+    Returns
+    -------
+    objective : Numpy Array
+        Objective coefficient of each variable in solver.variables().
+
+    """
+    
+    orders, production, delivery = index['orders'], index['production'], index['delivery']
+    objective = np.zeros((orders >= 0).sum() + (production >= 0).sum() + (delivery >= 0).sum())
+    objective_orders = sc['raw_materials'][:, :, None] + sc['raw_material_shipping'][:, None, :]
+    objective_production = sc['production_cost'].T
+    objective_delivery = np.broadcast_to(sc['shipping_costs'].T[:, None, :], delivery.shape)
     
+    objective[orders[orders >= 0]] = objective_orders[orders >= 0]
+    objective[production[production >= 0]] = objective_production[production >= 0]
+    objective[delivery[delivery >= 0]] = objective_delivery[delivery >= 0]
+    return objective
 
-    for s in suppliers:
-        for m in materials:
-            for f in factories:
-                if not str(supplier_stock.loc[s,m]) == 'nan':
-                    total_cost += orders_from_supplier[s+'_'+m+'_'+f].solution_value() * float(raw_materials.loc[s,m])
-                    total_cost += orders_from_supplier[s+'_'+m+'_'+f].solution_value() * float(raw_material_shipping.loc[s,f])
 
-            
-    # Part H (ii): Production Cost
-    for f in factories:
-        for p in products:
-            if not str(production_capacity.loc[p,f]) == 'nan':
-                total_cost += production_volume[f+'_'+p].solution_value() * float(production_cost.loc[p,f])
-         
-                  
-    # Part H (ii): Cost of delivery                                  
-    for c in customers:
-        for p in products:
-            for f in factories:
-                if not str(production_capacity.loc[p,f]) == 'nan' and not str(customer_demand.loc[p,c]) == 'nan':
-                    total_cost += delivery_customers[c+'_'+p+'_'+f].solution_value() * float(shipping_costs.loc[f,c])
-                  
-                
-    print("Total Optimal Cost: ", total_cost)
+class SupplyChainModel():
+    """
+    Supply chain LP that is kept between solves. Customer demand, supplier stock and production capacity 
+    can be changed and the model solved again, GLOP starts from the basis of the previous solve.
+
+    Parameters
+    ----------
+    d : Pandas DF
+        Supply chain data.
+    cache : ModelCache, optional
+        Load the model built on an earlier run with the same data instead of building it, and hint 
+        the solver with its last solution. The default is None.
+    backend, threads, time_limit : 
+        Solver backend and its limits, see create_solver. The default is GLOP.
+
+    """
+    
+    def __init__(self, d, cache=None, backend='GLOP', threads=None, time_limit=None):
+        self.sc_ = supply_chain_arrays(d)
+        self.cache_ = cache
+        self.key_ = None
+        self.backend_ = backend.upper()
+        solver_options = (backend, threads, time_limit)
+        if cache is None:
+            self.solver_, self.index_ = build_supply_chain_model(self.sc_, *solver_options)
+            return
+        
+        self.key_ = frame_fingerprint(d)
+        data, meta = cache.load('lp_task1', self.key_)
+        if data is None:
+            self.solver_, self.index_ = build_supply_chain_model(self.sc_, *solver_options)
+            model = linear_solver_pb2.MPModelProto()
+            self.solver_.ExportModelToProto(model)
+            cache.store('lp_task1', self.key_, model.SerializeToString(), 
+                        {'index': {k: v.tolist() for k, v in self.index_.items()}})
+            return
+        
+        model = linear_solver_pb2.MPModelProto.FromString(data)
+        self.solver_ = create_solver(*solver_options)
+        self.solver_.LoadModelFromProtoKeepNames(model)
+        self.index_ = {k: np.array(v, dtype=int) for k, v in meta['index'].items()}
+        if meta.get('solution'):
+            self.solver_.SetHint(self.solver_.variables(), meta['solution'])
+    
+    
+    def sheet_array(self, sheet, name, rows, columns):
+        """
+        Convert an updated sheet to an array in model order. Only the values can change, a combination 
+        that is NaN in the model has to stay NaN and vice versa.
+
+        Returns
+        -------
+        values : Numpy Array
+            Sheet values in model order.
+
+        """
+        
+        values = sheet.loc[self.sc_[rows], self.sc_[columns]].to_numpy(dtype=float)
+        if not np.array_equal(np.isnan(values), np.isnan(self.sc_[name])):
+            raise ValueError("Combinations in '{}' changed, build a new SupplyChainModel".format(name))
+        self.key_ = None            # Model no longer matches the cached one, don't store its solution
+        return values
+    
+    
+    def update_demand(self, customer_demand):
+        """
+        Change customer demand.
+
+        Parameters
+        ----------
+        customer_demand : Pandas DF
+            New 'Customer demand' sheet.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.sc_['customer_demand'] = self.sheet_array(customer_demand, 'customer_demand', 'products', 'customers')
+        customer_requirement = np.nansum(self.sc_['customer_demand'], axis=1)
+        material_requirements = customer_requirement @ np.nan_to_num(self.sc_['product_requirements'])
+        
+        constraints = self.solver_.constraints()
+        for p, row in enumerate(self.index_['requirement_rows']):
+            constraints[row].SetLb(customer_requirement[p])
+        for c, p in zip(*np.nonzero(self.index_['demand_rows'] >= 0)):
+            constraints[self.index_['demand_rows'][c,p]].SetLb(self.sc_['customer_demand'][p,c])
+        for m, row in enumerate(self.index_['material_rows']):
+            constraints[row].SetLb(material_requirements[m])
+    
+    
+    def update_stock(self, supplier_stock):
+        """
+        Change supplier stock.
+
+        Parameters
+        ----------
+        supplier_stock : Pandas DF
+            New 'Supplier stock' sheet.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.sc_['supplier_stock'] = self.sheet_array(supplier_stock, 'supplier_stock', 'suppliers', 'materials')
+        
+        constraints = self.solver_.constraints()
+        for s, m in zip(*np.nonzero(self.index_['stock_rows'] >= 0)):
+            constraints[self.index_['stock_rows'][s,m]].SetUb(self.sc_['supplier_stock'][s,m])
+    
+    
+    def update_capacity(self, production_capacity):
+        """
+        Change production capacity.
+
+        Parameters
+        ----------
+        production_capacity : Pandas DF
+            New 'Production capacity' sheet.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        self.sc_['production_capacity'] = self.sheet_array(production_capacity, 'production_capacity', 'products', 'factories')
+        
+        constraints = self.solver_.constraints()
+        for f, p in zip(*np.nonzero(self.index_['capacity_rows'] >= 0)):
+            constraints[self.index_['capacity_rows'][f,p]].SetUb(self.sc_['production_capacity'][p,f])
+    
+    
+    def update_costs(self, raw_materials=None, raw_material_shipping=None, production_cost=None, shipping_costs=None):
+        """
+        Change costs, sheets left as None keep their current values.
+
+        Parameters
+        ----------
+        raw_materials : Pandas DF, optional
+            New 'Raw material costs' sheet.
+        raw_material_shipping : Pandas DF, optional
+            New 'Raw material shipping' sheet.
+        production_cost : Pandas DF, optional
+            New 'Production cost' sheet.
+        shipping_costs : Pandas DF, optional
+            New 'Shipping costs' sheet.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if raw_materials is not None:
+            self.sc_['raw_materials'] = self.sheet_array(raw_materials, 'raw_materials', 'suppliers', 'materials')
+        if raw_material_shipping is not None:
+            self.sc_['raw_material_shipping'] = self.sheet_array(raw_material_shipping, 'raw_material_shipping', 'suppliers', 'factories')
+        if production_cost is not None:
+            self.sc_['production_cost'] = self.sheet_array(production_cost, 'production_cost', 'products', 'factories')
+        if shipping_costs is not None:
+            self.sc_['shipping_costs'] = self.sheet_array(shipping_costs, 'shipping_costs', 'factories', 'customers')
+        
+        cost = self.solver_.Objective()
+        for variable, coefficient in zip(self.solver_.variables(), supply_chain_objective(self.sc_, self.index_)):
+            cost.SetCoefficient(variable, coefficient)
+    
+    
+    def solve(self, presolve=False):
+        """
+        Solve the model. Without presolve the next GLOP solve starts from the basis of this one.
+
+        Parameters
+        ----------
+        presolve : BOOL, optional
+            Run GLOP presolve. GLOP then works on the presolved LP, so the next solve can't start from this 
+            basis. Only worth it for a model solved once. Other backends always use their own defaults. 
+            The default is False.
+
+        Returns
+        -------
+        status : INT
+            pywraplp solver status.
+
+        """
+        
+        parameters = pywraplp.MPSolverParameters()
+        if self.backend_ == 'GLOP':
+            if not presolve:
+                parameters.SetIntegerParam(parameters.PRESOLVE, parameters.PRESOLVE_OFF)
+            parameters.SetIntegerParam(parameters.INCREMENTALITY, parameters.INCREMENTALITY_ON)
+        status = self.solver_.Solve(parameters)
+        
+        if self.key_ is not None and status == pywraplp.Solver.OPTIMAL:
+            response = linear_solver_pb2.MPSolutionResponse()
+            self.solver_.FillSolutionResponseProto(response)
+            self.cache_.store_solution('lp_task1', self.key_, list(response.variable_value))
+        return status
+
+
+def supply_chain_solution(model):
+    """
+    Pull the solution of all decision variables into arrays
+
+    Parameters
+    ----------
+    model : SupplyChainModel
+        Solved supply chain model.
+
+    Returns
+    -------
+    orders : Numpy Array
+        Orders from suppliers [s,m,f], 0 where the variable doesn't exist.
+    production : Numpy Array
+        Production volume [f,p].
+    delivery : Numpy Array
+        Delivery to customers [c,p,f].
+
+    """
+    
+    response = linear_solver_pb2.MPSolutionResponse()
+    model.solver_.FillSolutionResponseProto(response)
+    values = np.append(np.array(response.variable_value), 0.0)         # Index -1 = variable doesn't exist = 0
+    
+    return values[model.index_['orders']], values[model.index_['production']], values[model.index_['delivery']]
+
+
+def report_frame(columns, names, values, mask=None):
+    """
+    Report in long format, one row per combination of names (in array order) where mask is True
+
+    Parameters
+    ----------
+    columns : LIST
+        Column names, one per array dimension followed by the value column.
+    names : LIST
+        Names along each array dimension.
+    values : Numpy Array
+        Report values.
+    mask : Numpy Array, optional
+        Combinations to report. The default is None (all).
+
+    Returns
+    -------
+    report : Pandas DF
+
+    """
     
+    if mask is None:
+        mask = np.ones(values.shape, dtype=bool)
+    positions = np.nonzero(mask)
+    report = {}
+    for column, n, i in zip(columns, names, positions):
+        report[column] = np.asarray(n)[i]
+    report[columns[-1]] = values[mask]
+    return pd.DataFrame(report, columns=columns)
+
+
+def supply_chain_reports(model):
+    """
+    Compute the Part J-N reports of a solved supply chain model with array reductions
+
+    Parameters
+    ----------
+    model : SupplyChainModel
+        Solved supply chain model.
+
+    Returns
+    -------
+    reports : DICT
+        Pandas DF for each report: 'orders' (J), 'supplier_bills' (K), 'production' (L), 'manufacturing_cost' (L ii), 
+        'deliveries' (M), 'shipping_cost' (M ii), 'material_fractions' (N).
+
+    """
+    
+    sc = model.sc_
+    suppliers, materials, factories, products, customers = sc['suppliers'], sc['materials'], sc['factories'], sc['products'], sc['customers']
+    stock_mask = ~np.isnan(sc['supplier_stock'])
+    requirement_mask = ~np.isnan(sc['product_requirements'])
+    capacity_mask = ~np.isnan(sc['production_capacity'])
+    demand_mask = ~np.isnan(sc['customer_demand'])
+    orders, production, delivery = supply_chain_solution(model)
+    
+    reports = {}
+    
+    # Part J. Material ordered by each factory from each supplier [f,s,m]
+    reports['orders'] = report_frame(['factory', 'supplier', 'material', 'units'], [factories, suppliers, materials], 
+                                     orders.transpose(2, 0, 1), np.broadcast_to(stock_mask, (len(factories),) + stock_mask.shape))
+    
+    # Part K. Bill from each supplier for material and delivery [f,s]
+    unit_cost = np.nan_to_num(sc['raw_materials'][:, :, None] + sc['raw_material_shipping'][:, None, :])     # [s,m,f]
+    reports['supplier_bills'] = report_frame(['factory', 'supplier', 'bill'], [factories, suppliers], (orders*unit_cost).sum(axis=1).T)
+    
+    # Part L. Units manufactured by each factory [f,p] and total manufacturing cost [f]
+    reports['production'] = report_frame(['factory', 'product', 'units'], [factories, products], production)
+    reports['manufacturing_cost'] = report_frame(['factory', 'cost'], [factories], (production*np.nan_to_num(sc['production_cost']).T).sum(axis=1))
+    
+    # Part M. Units shipped to each customer from each factory [c,f,p] and total shipping cost [c]
+    delivery_mask = demand_mask.T[:, :, None] & capacity_mask[None, :, :]
+    reports['deliveries'] = report_frame(['customer', 'factory', 'product', 'units'], [customers, factories, products], 
+                                         delivery.transpose(0, 2, 1), delivery_mask.transpose(0, 2, 1))
+    reports['shipping_cost'] = report_frame(['customer', 'cost'], [customers], (delivery*sc['shipping_costs'].T[:, None, :]).sum(axis=(1, 2)))
+    
+    # Part N. Fraction of each material ordered by each factory per customer [c,m,f]. Material ordered by a factory 
+    # counts once for every product it makes from the material for the customer
+    products_made = np.einsum('pm,pf,pc->cmf', requirement_mask.astype(int), capacity_mask.astype(int), demand_mask.astype(int))
+    customer_material = products_made * orders.sum(axis=0)[None, :, :]
+    total_material = customer_material.sum(axis=2, keepdims=True)
+    fraction = np.divide(customer_material, total_material, out=np.zeros(customer_material.shape), where=total_material != 0)
+    reports['material_fractions'] = report_frame(['customer', 'material', 'factory', 'fraction'], [customers, materials, factories], 
+                                                 fraction, np.broadcast_to(total_material != 0, fraction.shape))
+    
+    return reports
+
+
+def task1(d, cache=None, backend='GLOP', threads=None, time_limit=None):
+    """
+    Given supply chain information provided in accompanied data. Minimize the overall cost
+
+    Parameters
+    ----------
+    d : Pandas DF
+        Supply chain data.
+    cache : ModelCache, optional
+        Re-use model built on an earlier run with the same data. The default is None.
+    backend : STR, optional
+        LP backend, see create_solver. PDLP for instances too large for simplex. The default is 'GLOP'.
+    threads : INT, optional
+        Solver threads. The default is None (backend default).
+    time_limit : FLOAT, optional
+        Solve time limit in seconds. The default is None.
+
+    Returns
+    -------
+    reports : DICT
+        Pandas DF for each of the Part J-N reports, see supply_chain_reports. None if no solution was found 
+        (e.g. within time_limit).
+
+    """
+    
+    print('\n'+'-'*40)
+    print('\t\t\t\tTask 1')
+    print('-'*40+'\n')
+    
+    trace = TaskTrace('lp_task1')
+    
+    # Part A-H. Load data, build model from data arrays, constraints and objective loaded in bulk
+    trace.phase('build')
+    model = SupplyChainModel(d, cache, backend, threads, time_limit)
+    trace.model(model.solver_)
+
+    # Part I. Solve linear program
+    trace.phase('solve')
+    status = model.solve(presolve=True)
+    trace.solver(model.solver_, SOLVER_STATUS.get(status, status))
+    if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        print('No solution found: ', SOLVER_STATUS.get(status, status))
+        trace.end()
+        return None
+    print("Total Optimal Cost: ", model.solver_.Objective().Value())
+    
+    trace.phase('extract')
+    reports = supply_chain_reports(model)
 
     # Part J. Determine how much material to be ordered from each supplier
     print('\nPart J. How much material is ordered from each supplier')
-    f_s_m = {}
-    for f in factories:
-        f_s_m[f] = {}
-        for s in suppliers:
-            f_s_m[f][s] = {}
-            for m in materials:
-                if not str(supplier_stock.loc[s,m]) == 'nan':
-                    f_s_m[f][s][m] = orders_from_supplier[s+'_'+m+'_'+f].solution_value()
-                
-    for f in factories:
-        for s in f_s_m[f].keys(): 
-            for m in f_s_m[f][s].keys():
-                if int(f_s_m[f][s][m]) > 0:
-                    print('{} has to order {} of {} from {}'.format(f, int(f_s_m[f][s][m]), m, s))
+    for r in reports['orders'].itertuples():
+        if int(r.units) > 0:
+            print('{} has to order {} of {} from {}'.format(r.factory, int(r.units), r.material, r.supplier))
       
     
-
     # Part K. Determine for each factory supplier bill for material and delivery
-    # For each factory - supplier combination, compute total bill including raw materials and delivery charges
     print('\nPart K. Bill for materials and delivery for each factory')
-    
-    f_bill = {}         
-    for f in factories:
-        f_bill[f] = {}
-        for s in suppliers:
-            f_bill[f][s] = 0
-            for m in materials:
-                if not str(supplier_stock.loc[s,m]) == 'nan':
-                    f_bill[f][s] += orders_from_supplier[s+'_'+m+'_'+f].solution_value()*float(raw_material_shipping.loc[s,f])
-                    f_bill[f][s] += orders_from_supplier[s+'_'+m+'_'+f].solution_value()*float(raw_materials.loc[s,m])
-
-
-    for f in factories:
-        for s in f_bill[f].keys():
-            if  int(f_bill[f][s]) == 0:
-                continue
-            print("{} total bill from {} is {}".format(f, s, int(f_bill[f][s])))
+    for r in reports['supplier_bills'].itertuples():
+        if int(r.bill) == 0:
+            continue
+        print("{} total bill from {} is {}".format(r.factory, r.supplier, int(r.bill)))
     
                 
     # Part L. Determine number of products manufactured by each factory and total manufacturing cost
-    # For each factory/product compute number produced
     print('\nPart L. Number of units being manufactured by each factory')
+    for r in reports['production'].itertuples():
+        if int(r.units) == 0:
+            continue
+        print('{} manufactures {} of {}'.format(r.factory, int(r.units), r.product))
     
-    f_total_cost = {}
-    f_p = {}
-    
-    for f in factories:
-        f_total_cost[f] = 0
-        f_p[f] = {}
-        for p in products:
-            f_p[f][p] = 0
-            if not str(production_capacity.loc[p,f]) == 'nan':
-                f_p[f][p] += production_volume[f+'_'+p].solution_value() 
-                f_total_cost[f] += production_volume[f+'_'+p].solution_value() * production_cost.loc[p,f]
-                        
-
-    for f in factories:
-        for p in f_p[f].keys():
-            if int(f_p[f][p]) == 0:
+    print('\nPart L (ii): Total manufacturing cost for each factory')
+    for r in reports['manufacturing_cost'].itertuples():
+        print('{} total manufacturing cost is {}'.format(r.factory, r.cost))
+        
+
+    # Part M. For each customer determine how many units are being manufactured at each factory and shipping cost for customers
+    print('\nPart M (i): Units being shipped to customers from each factory') 
+    for r in reports['deliveries'].itertuples():
+        if int(r.units) == 0:
+            continue
+        print('{} is being shipped {} of {} from {}'.format(r.customer, int(r.units), r.product, r.factory))
+
+    print('\nPart M (ii): Total shipping cost for each customer')
+    for r in reports['shipping_cost'].itertuples():
+        print("Total shipping cost for {} is {}".format(r.customer, r.cost))
+        
+    
+    # Part N [i]. Determine fraction of each material each factory has to order for each customer
+    print('\nPart N (i): Fraction of material each factory has to make per customer')
+    fractions = reports['material_fractions']
+    for c in model.sc_['customers']:
+        print(c)
+        for r in fractions[fractions.customer == c].itertuples():
+            if r.fraction == 0.0:
                 continue
-            print('{} manufactures {} of {}'.format(f, int(f_p[f][p]), p))
+            print('\t- {} has to order {}% of {}'.format(r.factory, r.fraction*100, r.material))
     
-            
+    trace.end()
+    return reports
+
+
+SOLVER_STATUS = {pywraplp.Solver.OPTIMAL: 'OPTIMAL', pywraplp.Solver.FEASIBLE: 'FEASIBLE', pywraplp.Solver.INFEASIBLE: 'INFEASIBLE', 
+                 pywraplp.Solver.UNBOUNDED: 'UNBOUNDED', pywraplp.Solver.ABNORMAL: 'ABNORMAL', pywraplp.Solver.MODEL_INVALID: 'MODEL_INVALID', 
+                 pywraplp.Solver.NOT_SOLVED: 'NOT_SOLVED'}
+
+
+def scenario_data(d, scenario):
+    """
+    Apply a what-if scenario to the supply chain data
+
+    Parameters
+    ----------
+    d : Pandas DF
+        Base supply chain data.
+    scenario : DICT
+        'name' : scenario name
+        'demand_multiplier' : FLOAT, all customer demand is multiplied by it
+        'supplier_outage' : LIST, suppliers with no stock
+        'shipping_cost_multiplier' : FLOAT, raw material shipping and shipping costs are multiplied by it
+        Any sheet in SCENARIO_SHEETS (e.g. 'Raw material costs') : Pandas DF replacing that sheet
+
+    Returns
+    -------
+    d : Pandas DF
+        Supply chain data for the scenario, sheets not changed are shared with the base data.
+
+    """
     
-    print('\nPart L (ii): Total manufacturing cost for each factory')
-    for f in factories:
-        print('{} total manufacturing cost is {}'.format(f, f_total_cost[f]))
-        
+    d = dict(d)
+    for sheet in scenario:
+        if sheet in d:
+            d[sheet] = scenario[sheet]
+    
+    if 'demand_multiplier' in scenario:
+        d['Customer demand'] = d['Customer demand'] * scenario['demand_multiplier']
+    if 'supplier_outage' in scenario:
+        d['Supplier stock'] = d['Supplier stock'].copy()
+        d['Supplier stock'].loc[scenario['supplier_outage']] *= 0            # NaN stays NaN
+    if 'shipping_cost_multiplier' in scenario:
+        d['Raw material shipping'] = d['Raw material shipping'] * scenario['shipping_cost_multiplier']
+        d['Shipping costs'] = d['Shipping costs'] * scenario['shipping_cost_multiplier']
+    
+    return d
+
+
+SCENARIO_SHEETS = ('Customer demand', 'Supplier stock', 'Production capacity', 'Raw material costs', 
+                   'Raw material shipping', 'Production cost', 'Shipping costs')       # Sheets run_scenario can update on a built model
+
+scenario_worker_data = None         # (base data, SupplyChainModel) in each scenario worker process
+
+
+def init_scenario_worker(d):
+    """
+    Build the supply chain model once in a scenario worker process
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    global scenario_worker_data
+    scenario_worker_data = (d, SupplyChainModel(d))
+
+
+def run_scenario(scenario):
+    """
+    Solve one scenario on the scenario worker's model. Every bound and cost is set from the base data, 
+    so the result doesn't depend on which scenarios the worker solved before.
+
+    Parameters
+    ----------
+    scenario : DICT
+        Scenario, see scenario_data.
+
+    Returns
+    -------
+    result : DICT
+        Scenario name, solver status, optimal cost, units produced by each factory and ordered from each supplier.
+
+    """
+    
+    d, model = scenario_worker_data
+    for sheet in scenario:
+        if sheet in d and sheet not in SCENARIO_SHEETS:
+            raise ValueError("Scenario '{}' replaces sheet '{}' which can't be updated on the built model".format(scenario.get('name'), sheet))
+    sd = scenario_data(d, scenario)
+    model.update_demand(sd['Customer demand'])
+    model.update_stock(sd['Supplier stock'])
+    model.update_capacity(sd['Production capacity'])
+    model.update_costs(sd['Raw material costs'], sd['Raw material shipping'], sd['Production cost'], sd['Shipping costs'])
+    status = model.solve()
+    
+    result = {'scenario': scenario.get('name'), 'status': SOLVER_STATUS[status], 'total_cost': np.nan}
+    production = np.full(len(model.sc_['factories']), np.nan)
+    orders = np.full(len(model.sc_['suppliers']), np.nan)
+    if status == pywraplp.Solver.OPTIMAL:
+        result['total_cost'] = model.solver_.Objective().Value()
+        sol_orders, sol_production, _ = supply_chain_solution(model)
+        production = sol_production.sum(axis=1)
+        orders = sol_orders.sum(axis=(1, 2))
+    for f, factory in enumerate(model.sc_['factories']):
+        result[factory+' production'] = production[f]
+    for s, supplier in enumerate(model.sc_['suppliers']):
+        result[supplier+' orders'] = orders[s]
+    
+    return result
+
+
+def task1_scenarios(d, scenarios, output=None, workers=1):
+    """
+    Solve the supply chain LP for a list or stream of what-if scenarios
+
+    Parameters
+    ----------
+    d : Pandas DF
+        Base supply chain data, shared read-only by all scenarios.
+    scenarios : ITERABLE
+        Scenarios, see scenario_data.
+    output : STR, optional
+        CSV or Parquet (.parquet) file each result is written to as soon as its scenario is solved. The default is None.
+    workers : INT, optional
+        Number of processes scenarios are solved on, each keeps its own model. The default is 1.
+
+    Returns
+    -------
+    results : Pandas DF
+        One row per scenario in the order given: scenario, status, total_cost and key flows.
+
+    """
+    
+    print('\n'+'-'*40)
+    print('\t\t\tTask 1: Scenarios')
+    print('-'*40+'\n')
+    
+    writer = None
+    results = {}
+    
+    def record(i, result):
+        nonlocal writer
+        results[i] = result
+        print('{}: {} Total Optimal Cost: {}'.format(result['scenario'], result['status'], result['total_cost']))
+        if output is None:
+            return
+        if writer is None:
+            writer = ScenarioWriter(output, list(result.keys()))
+        writer.write(result)
+    
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(workers, initializer=init_scenario_worker, initargs=(d,)) as executor:
+                pending = {}
+                for i, scenario in enumerate(scenarios):
+                    pending[executor.submit(run_scenario, scenario)] = i
+                    if len(pending) >= workers*2:                   # Keep a bounded number of scenarios in flight
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record(pending.pop(future), future.result())
+                for future in as_completed(pending):
+                    record(pending[future], future.result())
+        else:
+            init_scenario_worker(d)
+            for i, scenario in enumerate(scenarios):
+                record(i, run_scenario(scenario))
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    return pd.DataFrame([results[i] for i in sorted(results)])
+
+
+class ScenarioWriter():
+    """
+    Append scenario results to a CSV or Parquet file one row at a time
 
-    # Part M. For each customer determine how many units are being manufactured at each factory and shipping cost for customers
-    print('\nPart M (i): Units being shipped to customers from each factory') 
-    
-    c_u = {}    # Customer units shipped
-    c_sc = {}   # Customer shipping cost
-    
-    for c in customers:
-        c_u[c] = {}
-        c_sc[c] = 0
-        for f in factories:
-            c_u[c][f] = {}
-            for p in products:
-                if not str(production_capacity.loc[p,f]) == 'nan' and not str(customer_demand.loc[p,c]) == 'nan':
-                    c_u[c][f][p] = delivery_customers[c+'_'+p+'_'+f].solution_value()
-                    c_sc[c] += delivery_customers[c+'_'+p+'_'+f].solution_value() * float(shipping_costs.loc[f,c])
-                    
-
-    for c in customers:
-        for f in c_u[c].keys():
-            for p in c_u[c][f].keys():
-                if int(c_u[c][f][p]) == 0:
-                    continue
-                print('{} is being shipped {} of {} from {}'.format(c, int(c_u[c][f][p]), p, f))
+    Parameters
+    ----------
+    path : STR
+        Output file, Parquet if it ends with .parquet (needs pyarrow) otherwise CSV.
+    columns : LIST
+        Result columns.
 
-    print('\nPart M (ii): Total shipping cost for each customer')
-    for c in customers:
-        print("Total shipping cost for {} is {}".format(c, c_sc[c]))
-        
+    """
     
-    # Part N [i]. Determine fraction of each material each factory has to order for each customer
-    print('\nPart N (i): Fraction of material each factory has to make per customer')
+    def __init__(self, path, columns):
+        self.columns_ = columns
+        if path.endswith('.parquet'):
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError('Parquet output needs pyarrow, write to a .csv file instead')
+            self.pa_ = pyarrow
+            self.file_ = None
+            self.writer_ = pyarrow.parquet.ParquetWriter(path, self.schema())
+        else:
+            self.file_ = open(path, 'w', newline='')
+            self.writer_ = csv.DictWriter(self.file_, fieldnames=columns)
+            self.writer_.writeheader()
     
-    cmf = {}
-    total_m = {}
-    for c in customers:
-        cmf[c] = {}
-        total_m[c] = {}
-        for m in materials:
-            cmf[c][m] = {}
-            total_m[c][m] = 0
-            for f in factories:
-                if f not in cmf[c][m].keys():
-                    cmf[c][m][f] = 0
-                for s in suppliers:
-                    for p in products:
-                        if not str(supplier_stock.loc[s,m]) == 'nan' and not str(product_requirements.loc[p,m]) == 'nan' and \
-                        not str(production_capacity.loc[p,f]) == 'nan' and not str(customer_demand.loc[p,c]) == 'nan':
-                            cmf[c][m][f] += orders_from_supplier[s+'_'+m+'_'+f].solution_value()
-                            total_m[c][m] += orders_from_supplier[s+'_'+m+'_'+f].solution_value()
-
-    cmf_fract = {}
-    for c in customers:
-        cmf_fract[c] = {}
-        print(c)
-        for m in cmf[c].keys():
-            cmf_fract[c][m] = {}
-            for f in cmf[c][m].keys():
-                pass
-                try:
-                    fraction = cmf[c][m][f]/total_m[c][m]
-                    cmf_fract[c][m][f] = fraction
-                except ZeroDivisionError:
-                    continue
-                if fraction == 0.0:
-                    continue
-                print('\t- {} has to order {}% of {}'.format(f, fraction*100, m))
+    def schema(self):
+        fields = [('scenario', self.pa_.string()), ('status', self.pa_.string())]
+        for c in self.columns_[2:]:
+            fields.append((c, self.pa_.float64()))
+        return self.pa_.schema(fields)
+    
+    def write(self, result):
+        if self.file_ is None:
+            self.writer_.write_table(self.pa_.Table.from_pylist([result], schema=self.schema()))
+        else:
+            self.writer_.writerow(result)
+            self.file_.flush()
+    
+    def close(self):
+        if self.file_ is None:
+            self.writer_.close()
+        else:
+            self.file_.close()
 
 
         
-def task2(d):
+def task2(d, formulation='subsets', towns_to_visit=None, starting_town='Cork', backend='CBC', threads=None, time_limit=None):
     """
     Given travel distances find shortest route visiting all towns contained in towns_to_visit list. 
     Using Linear Programming
@@ -367,10 +914,26 @@ def task2(d):
     ----------
     d : pandas DF
         Town distances.
+    formulation : STR, optional
+        How self-contained routes are eliminated. 'subsets' adds a constraint for every subset of towns 
+        up front, 'lazy' starts without any and only adds the subset constraints violated by each 
+        integer solution until a single tour is left. 'mtz' (Miller-Tucker-Zemlin visiting order) and 
+        'flow' (single commodity flow) are compact formulations of size O(n^2). The default is 'subsets'.
+    towns_to_visit : LIST, optional
+        Towns on the route. The default is None (the ten towns of the original problem).
+    starting_town : STR, optional
+        Town the route starts and ends in. The default is 'Cork'.
+    backend : STR, optional
+        MIP backend, 'CBC', 'SCIP' or 'CP_SAT', see create_solver. The default is 'CBC'.
+    threads : INT, optional
+        Solver threads. The default is None (backend default).
+    time_limit : FLOAT, optional
+        Time limit in seconds of each solve. The default is None.
 
     Returns
     -------
-    None.
+    status : INT
+        pywraplp solver status of the last solve.
 
     """
 
@@ -381,9 +944,11 @@ def task2(d):
     distances = d['Distances']
 
     all_towns = distances.columns.values
-    towns_to_visit = ['Cork', 'Dublin', 'Limerick', 'Waterford', 'Galway', 'Wexford', 'Belfast', 'Athlone', 'Rosslare', 'Wicklow']
-    starting_town = 'Cork'
-    solver = pywraplp.Solver('LPWrapper', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+    if towns_to_visit is None:
+        towns_to_visit = ['Cork', 'Dublin', 'Limerick', 'Waterford', 'Galway', 'Wexford', 'Belfast', 'Athlone', 'Rosslare', 'Wicklow']
+    trace = TaskTrace('lp_task2')
+    trace.phase('build')
+    solver = create_solver(backend, threads, time_limit, mip=True)
     
     towns_pairs = {}
     
@@ -410,19 +975,22 @@ def task2(d):
                 
          
     # Part D. Implement constraints that there are no self-contained routes.    
-    subsets = list()
-    
-    for n in range(len(towns_to_visit)):
-        if n > 1:
-            subsets += list(combinations(towns_to_visit, n))            # Get all possible subsets
-    
-    # For each subset implement a constraint that the number of journey pairs is less than the total number of destinations in the subset
-    for subset in subsets:    
-        constraint = solver.Constraint(0, len(subset)-1)
-        for pair in towns_pairs:
-            t1, t2 = pair.split('_')[0], pair.split('_')[1]
-            if t1 in subset and t2 in subset:
-                constraint.SetCoefficient(towns_pairs[pair], 1)
+    if formulation == 'subsets':
+        subsets = list()
+        
+        for n in range(len(towns_to_visit)):
+            if n > 1:
+                subsets += list(combinations(towns_to_visit, n))            # Get all possible subsets
+        
+        # For each subset implement a constraint that the number of journey pairs is less than the total number of destinations in the subset
+        for subset in subsets:    
+            add_subtour_constraint(solver, towns_pairs, subset)
+    elif formulation == 'mtz':
+        add_mtz_constraints(solver, towns_pairs, towns_to_visit, starting_town)
+    elif formulation == 'flow':
+        add_flow_constraints(solver, towns_pairs, towns_to_visit, starting_town)
+    elif formulation != 'lazy':
+        raise ValueError("Unknown formulation '{}'".format(formulation))
 
 
     # Task E: Minimize distance to be travelled
@@ -434,8 +1002,32 @@ def task2(d):
         distance.SetCoefficient(towns_pairs[pair], float(distances.loc[t1,t2]))
     
     distance.SetMinimization()
-    solver.Solve()
+    trace.model(solver)
+    trace.phase('solve')
+    status = solver.Solve()
+    
+    # Part D (lazy). Add a constraint for each self-contained route in the solution and solve again until one tour is left
+    if formulation == 'lazy':
+        rounds = 1
+        cuts = 0
+        while status in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+            subtours = find_subtours(towns_pairs, starting_town)
+            if len(subtours) <= 1:
+                break
+            for subtour in subtours:
+                add_subtour_constraint(solver, towns_pairs, subtour)
+                cuts += 1
+            status = solver.Solve()
+            rounds += 1
+        
+        print('Subtour Elimination Rounds: {} Cuts Added: {}'.format(rounds, cuts))
+    trace.solver(solver, SOLVER_STATUS.get(status, status))
+    if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        print('No route found: ', SOLVER_STATUS.get(status, status))
+        trace.end()
+        return status
     
+    trace.phase('extract')
     total_distance = 0
     for pair in towns_pairs:
         t1, t2 = pair.split('_')[0], pair.split('_')[1]
@@ -466,10 +1058,488 @@ def task2(d):
     route.append(starting_town)
     for t in route:
         print('\t-',t)
+    trace.end()
+    return status
             
 
+
+def add_subtour_constraint(solver, towns_pairs, subset):
+    """
+    Add constraint that the number of journey pairs within subset is less than the number of towns in it
+
+    Parameters
+    ----------
+    solver : pywraplp.Solver
+        Routing model.
+    towns_pairs : DICT
+        Decision variables for pairs of towns, key = 'origin_destination'.
+    subset : LIST
+        Towns which must not form a self-contained route.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    constraint = solver.Constraint(0, len(subset)-1)
+    for t1 in subset:
+        for t2 in subset:
+            if t1 != t2:
+                constraint.SetCoefficient(towns_pairs[t1+'_'+t2], 1)
+
+
+def add_mtz_constraints(solver, towns_pairs, towns_to_visit, starting_town):
+    """
+    Add Miller-Tucker-Zemlin constraints. Each town other than the starting town gets a position on the route, 
+    and travelling from t1 to t2 forces t2 to come after t1. A self-contained route not passing through the 
+    starting town can't satisfy this.
+
+    Parameters
+    ----------
+    solver : pywraplp.Solver
+        Routing model.
+    towns_pairs : DICT
+        Decision variables for pairs of towns, key = 'origin_destination'.
+    towns_to_visit : LIST
+        Towns on the route.
+    starting_town : STR
+        Town the route starts and ends in.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    n = len(towns_to_visit)
+    order = {}
+    for t in towns_to_visit:
+        if t != starting_town:
+            order[t] = solver.IntVar(1, n-1, 'order_'+t)
+    
+    # order[t2] >= order[t1] + 1 if pair t1_t2 is on the route
+    for t1 in order:
+        for t2 in order:
+            if t1 == t2:
+                continue
+            constraint = solver.Constraint(-solver.infinity(), n-2)
+            constraint.SetCoefficient(order[t1], 1)
+            constraint.SetCoefficient(order[t2], -1)
+            constraint.SetCoefficient(towns_pairs[t1+'_'+t2], n-1)
+
+
+def add_flow_constraints(solver, towns_pairs, towns_to_visit, starting_town):
+    """
+    Add single commodity flow constraints. The starting town sends one unit to every other town, 
+    flow can only use pairs on the route and each town keeps one unit, so every town must be reachable 
+    from the starting town.
+
+    Parameters
+    ----------
+    solver : pywraplp.Solver
+        Routing model.
+    towns_pairs : DICT
+        Decision variables for pairs of towns, key = 'origin_destination'.
+    towns_to_visit : LIST
+        Towns on the route.
+    starting_town : STR
+        Town the route starts and ends in.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    n = len(towns_to_visit)
+    flow = {}
+    for pair in towns_pairs:
+        flow[pair] = solver.NumVar(0, solver.infinity(), 'flow_'+pair)
+        
+        # Flow only on pairs on the route
+        constraint = solver.Constraint(-solver.infinity(), 0)
+        constraint.SetCoefficient(flow[pair], 1)
+        constraint.SetCoefficient(towns_pairs[pair], -(n-1))
+    
+    # Starting town sends n-1 units, every other town keeps one
+    for t in towns_to_visit:
+        if t == starting_town:
+            constraint = solver.Constraint(n-1, n-1)
+        else:
+            constraint = solver.Constraint(-1, -1)
+        for pair in flow:
+            t1, t2 = pair.split('_')[0], pair.split('_')[1]
+            if t == t1:
+                constraint.SetCoefficient(flow[pair], 1)
+            if t == t2:
+                constraint.SetCoefficient(flow[pair], -1)
+
+
+def find_subtours(towns_pairs, starting_town):
+    """
+    Split the current integer solution into its self-contained routes
+
+    Parameters
+    ----------
+    towns_pairs : DICT
+        Solved decision variables for pairs of towns, key = 'origin_destination'.
+    starting_town : STR
+        Town the first route is followed from.
+
+    Returns
+    -------
+    subtours : LIST
+        List of routes, each a list of towns. A single route means the solution is a full tour.
+
+    """
+    
+    next_town = {}
+    for pair in towns_pairs:
+        if towns_pairs[pair].solution_value() > 0.5:
+            t1, t2 = pair.split('_')[0], pair.split('_')[1]
+            next_town[t1] = t2
+    
+    subtours = []
+    while len(next_town) > 0:
+        current_stop = starting_town if starting_town in next_town else next(iter(next_town))
+        subtour = []
+        while current_stop in next_town:
+            subtour.append(current_stop)
+            current_stop = next_town.pop(current_stop)
+        subtours.append(subtour)
+    
+    return subtours
+
+
+    
+def loop_lines_of(trains):
+    """
+    Loop lines listed in the optional 'Loop' column of the trains sheet, None if there is no such column.
+    """
+    
+    if 'Loop' not in trains.columns:
+        return None
+    return [l for l in trains.index.values if trains.loc[l, 'Loop'] == 1]
+
+
+def build_station_adjacency(stops, distances, lines, loop_lines=None):
+    """
+    Index which stations are connected and by which lines. Consecutive stops on a line are connected, 
+    and the last stop of a loop line connects back to its first.
+
+    Parameters
+    ----------
+    stops : Pandas DF
+        Stop number of each station on each line.
+    distances : Pandas DF
+        Travel time between connected stations.
+    lines : LIST
+        Train lines.
+    loop_lines : LIST, optional
+        Lines that are loops. The default is None: a line is taken to be a loop if its first and last 
+        stops are connected in the distances sheet and no other line runs between them, as the 
+        connection otherwise belongs to that line.
+
+    Returns
+    -------
+    adjacency : DICT
+        key = station, value = dict of key = neighbouring station, value = list of lines connecting them.
+
+    """
+    
+    adjacency = {}
+    for s in stops.index.values:
+        adjacency[s] = {}
+    
+    line_hops = {}
+    for l in lines:
+        line_stops = stops[l].dropna().sort_values().index.values
+        line_hops[l] = list(zip(line_stops[:-1], line_stops[1:]))
+    
+    for l in lines:
+        line_stops = stops[l].dropna().sort_values().index.values
+        hops = line_hops[l]
+        if len(line_stops) > 2:
+            closing = (line_stops[-1], line_stops[0])
+            if loop_lines is None:
+                other_hops = {frozenset(hop) for other in lines if other != l for hop in line_hops[other]}
+                is_loop = not pd.isna(distances.loc[closing]) and frozenset(closing) not in other_hops
+            else:
+                is_loop = l in loop_lines
+            if is_loop:
+                hops = hops + [closing]                                # Loop line, last stop connects back to the first
+        
+        for s1, s2 in hops:
+            if s2 not in adjacency[s1]:
+                adjacency[s1][s2] = []
+            if s1 not in adjacency[s2]:
+                adjacency[s2][s1] = []
+            adjacency[s1][s2].append(l)
+            adjacency[s2][s1].append(l)
+    
+    return adjacency
+
+
+def optimal_route_mip(start_end, adjacency, distances, stations):
+    """
+    Find the route with the shortest travel time between two stations by solving a MIP
+
+    Parameters
+    ----------
+    start_end : TUPLE
+        (origin, destination) station pair.
+    adjacency : DICT
+        Station adjacency index from build_station_adjacency.
+    distances : Pandas DF
+        Travel time between connected stations.
+    stations : LIST
+        Stations on the network.
+
+    Returns
+    -------
+    total_distance : FLOAT
+        Total travel time.
+    route : LIST
+        Hops (s1, s2) from origin to destination.
+
+    """
+    
+    start = start_end[0]
+    end = start_end[1]
+
+    # Part B. Determine time required to travel between two stations
+    solver = pywraplp.Solver('LPWrapper', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+
+
+    # Create decision variables for each connected pair of stations
+    station_pairs = {}
+
+    # Part B (a). For each line, create a decision variable for stations connected
+    for s1 in stations:
+        for s2 in adjacency[s1]:
+            for l in adjacency[s1][s2]:
+                station_pairs[l+'_'+s1+'_'+s2] = solver.IntVar(0, 1, l+'_'+s1+'_'+s2)
+
+
+    # Part B (b) (i). Implement constraints that origin is included in the path
+    constraint = solver.Constraint(1,1)
+    for pair in station_pairs:
+        s1, s2 = pair.split('_')[1], pair.split('_')[2]
+        if start == s1:
+            constraint.SetCoefficient(station_pairs[pair], 1)           
+
+    # Part B (b) (ii). Implement constraints that final station is last stop
+    constraint = solver.Constraint(1,1)
+    for pair in station_pairs:
+        s1, s2 = pair.split('_')[1], pair.split('_')[2]
+        if end == s2:
+            constraint.SetCoefficient(station_pairs[pair], 1)
+
+    # Part B (b) (ii). Implement constraints that there are no dead ends.
+
+    # Ensure start and end are not visited more than once
+    constraint = solver.Constraint(0,0)
+    for pair in station_pairs:
+        s1, s2 = pair.split('_')[1], pair.split('_')[2]
+        if end == s1:
+            constraint.SetCoefficient(station_pairs[pair], 1)
+
+    constraint = solver.Constraint(0,0)
+    for pair in station_pairs:
+        s1, s2 = pair.split('_')[1], pair.split('_')[2]
+        if start == s2:
+            constraint.SetCoefficient(station_pairs[pair], 1)
+
+
+    # Ensure all stations that are visited (excluding origin and destination) have two journey pairs (arriving and leaving) or not visited at all
+    for s in stations:
+        if s in start_end:
+            continue
+        constraint = solver.Constraint(0, 0)
+        for pair in station_pairs:
+            s1, s2 = pair.split('_')[1], pair.split('_')[2]
+            if s == s1 :
+                constraint.SetCoefficient(station_pairs[pair], 1)
+            if s == s2 :
+                constraint.SetCoefficient(station_pairs[pair], -1)
+
+    # Part B (c). Minimize the overall travel time
+    distance = solver.Objective()
+
+    for pair in station_pairs:
+        s1, s2 = pair.split('_')[1], pair.split('_')[2]
+        distance.SetCoefficient(station_pairs[pair], float(distances.loc[s1,s2]))
+
+    distance.SetMinimization()
+    solver.Solve()
+
+    total_distance = 0
+    for pair in station_pairs:
+        s1, s2 = pair.split('_')[1], pair.split('_')[2]
+        total_distance += station_pairs[pair].solution_value() * distances.loc[s1,s2]
+
+    route = []
+    last_stop = start
+    # Obtain route from optimized result including lines
+    while not last_stop == end:                                            # Continue looping until we reach the last stop
+        for pair in station_pairs:
+            l, s1, s2 = pair.split('_')[0], pair.split('_')[1], pair.split('_')[2]
+            if s1 == last_stop:
+                if station_pairs[pair].solution_value() > 0:
+                    pair_route = (s1,s2)
+                    route.append(pair_route)
+                    last_stop = s2
+    
+    return total_distance, route
+
+
+route_worker_data = None            # (adjacency, distances, stations) in each route worker process
+
+
+def init_route_worker(adjacency, distances, stations):
+    """
+    Store the train network data in a route worker process so it is only sent to each process once
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    global route_worker_data
+    route_worker_data = (adjacency, distances, stations)
+
+
+def optimal_route_worker(start_end):
+    """
+    Solve the route MIP for one origin/destination pair in a route worker process. Each call builds its own solver
+
+    Parameters
+    ----------
+    start_end : TUPLE
+        (origin, destination) station pair.
+
+    Returns
+    -------
+    TUPLE
+        (total travel time, list of hops (s1, s2)).
+
+    """
+    
+    return optimal_route_mip(start_end, *route_worker_data)
+
+
+def shortest_routes_dijkstra(adjacency, distances, stations):
+    """
+    Find the routes with the shortest travel time between all stations using Dijkstra's algorithm from each station
+
+    Parameters
+    ----------
+    adjacency : DICT
+        Station adjacency index from build_station_adjacency.
+    distances : Pandas DF
+        Travel time between connected stations.
+    stations : LIST
+        Stations on the network.
+
+    Returns
+    -------
+    optimal_routes : DICT
+        key = (origin, destination), value = (total travel time, list of hops (s1, s2)).
+
+    """
+    
+    neighbours = {}
+    for s1 in stations:
+        neighbours[s1] = []
+        for s2 in adjacency[s1]:
+            neighbours[s1].append((s2, float(distances.loc[s1,s2])))
+    
+    optimal_routes = {}
+    for start in stations:
+        travel_time = {start: 0.0}
+        previous_stop = {}
+        visited = set()
+        queue = [(0.0, start)]
+        while len(queue) > 0:
+            time_s1, s1 = heapq.heappop(queue)
+            if s1 in visited:
+                continue
+            visited.add(s1)
+            for s2, distance in neighbours[s1]:
+                if s2 not in travel_time or time_s1 + distance < travel_time[s2]:
+                    travel_time[s2] = time_s1 + distance
+                    previous_stop[s2] = s1
+                    heapq.heappush(queue, (travel_time[s2], s2))
+        
+        for end in previous_stop:
+            route = []
+            last_stop = end
+            while not last_stop == start:
+                route.insert(0, (previous_stop[last_stop], last_stop))
+                last_stop = previous_stop[last_stop]
+            optimal_routes[(start,end)] = (travel_time[end], route)
+    
+    return optimal_routes
+
+
+def shortest_routes_floyd_warshall(adjacency, distances, stations):
+    """
+    Find the routes with the shortest travel time between all stations using the Floyd-Warshall algorithm on a distance matrix
+
+    Parameters
+    ----------
+    adjacency : DICT
+        Station adjacency index from build_station_adjacency.
+    distances : Pandas DF
+        Travel time between connected stations.
+    stations : LIST
+        Stations on the network.
+
+    Returns
+    -------
+    optimal_routes : DICT
+        key = (origin, destination), value = (total travel time, list of hops (s1, s2)).
+
+    """
+    
+    n = len(stations)
+    station_index = {}
+    for i, s in enumerate(stations):
+        station_index[s] = i
+    
+    travel_time = np.full((n, n), np.inf)
+    np.fill_diagonal(travel_time, 0)
+    next_stop = np.full((n, n), -1)             # next_stop[i,j] = index of the station after i on the route from i to j
+    for s1 in stations:
+        for s2 in adjacency[s1]:
+            i, j = station_index[s1], station_index[s2]
+            travel_time[i,j] = float(distances.loc[s1,s2])
+            next_stop[i,j] = j
     
-def task3(d):
+    for k in range(n):
+        via_k = travel_time[:, k:k+1] + travel_time[k:k+1, :]
+        shorter = via_k < travel_time
+        travel_time = np.where(shorter, via_k, travel_time)
+        next_stop = np.where(shorter, next_stop[:, k:k+1], next_stop)
+    
+    optimal_routes = {}
+    for i, start in enumerate(stations):
+        for j, end in enumerate(stations):
+            if i == j or next_stop[i,j] < 0:
+                continue
+            route = []
+            last_stop = i
+            while not last_stop == j:
+                route.append((stations[last_stop], stations[next_stop[last_stop,j]]))
+                last_stop = next_stop[last_stop,j]
+            optimal_routes[(start,end)] = (float(travel_time[i,j]), route)
+    
+    return optimal_routes
+
+
+def task3(d, route_engine='dijkstra', workers=1, backend='CBC', threads=None, time_limit=None):
     """
     Train network - optimize the number of trains active on a network.
 
@@ -477,10 +1547,23 @@ def task3(d):
     ----------
     d : Pandas DF
         Train network data.
+    route_engine : STR, optional
+        How the routes with the shortest travel time between all stations are found. 'dijkstra' runs Dijkstra's 
+        algorithm from each station, 'floyd_warshall' finds all routes at once on a distance matrix and 'mip' 
+        solves a MIP for every origin/destination pair (kept for cross-checking). The default is 'dijkstra'.
+    workers : INT, optional
+        Number of processes the 'mip' route engine solves origin/destination pairs on. The default is 1.
+    backend : STR, optional
+        MIP backend of the train requirement model (Part C), see create_solver. The default is 'CBC'.
+    threads : INT, optional
+        Solver threads of the train requirement model. The default is None (backend default).
+    time_limit : FLOAT, optional
+        Time limit in seconds of the train requirement model. The default is None.
 
     Returns
     -------
-    None.
+    status : INT
+        pywraplp solver status of the train requirement model.
 
     """
     
@@ -515,135 +1598,42 @@ def task3(d):
     print('-'*40+'\n')
     
   
+    trace = TaskTrace('lp_task3')
+    trace.phase('routes')
+    adjacency = build_station_adjacency(stops, distances, lines, loop_lines_of(trains))
+    
     station_pair_list = list()                  # List of all connected station pairs
     pair_lines = {}                             # Dictionary of containing list of lines operating on all connected station pairs
+    for s1 in stations:
+        for s2 in adjacency[s1]:
+            station_pair_list.append((s1,s2))
+            pair_lines[(s1,s2)] = adjacency[s1][s2]
     
-    # List containing lines which are loops
-    loop_lines = ['L2']
     
-    for l in lines:
-        for s1 in stations:
-            if str(stops.loc[s1,l]) == 'nan':
-                continue
-            for s2 in stations:
-                if str(stops.loc[s2,l]) == 'nan' or s1 == s2:
-                    continue
-                if abs(stops.loc[s2,l] - stops.loc[s1,l]) == 1:
-                    if (s1,s2) not in pair_lines.keys():                # If
-                        pair_lines[(s1,s2)] = []
-                    pair_lines[(s1,s2)].append(l)
-                    if (s1,s2) not in station_pair_list:
-                        station_pair_list.append((s1,s2))
-                else:
-                    if l in loop_lines:
-                        no_stops = stops[l].count()             #Number of stops
-                        if (stops.loc[s1,l] == 1 and stops.loc[s2,l] == no_stops) or (stops.loc[s2,l] == 1 and stops.loc[s1,l] == no_stops):
-                            if (s1,s2) not in pair_lines.keys():
-                                pair_lines[(s1,s2)] = []
-                            pair_lines[(s1,s2)].append(l)
-                            if (s1,s2) not in station_pair_list:
-                                station_pair_list.append((s1,s2))
+    # Part B. Determine time required to travel between all pairs of stations
+    if route_engine == 'dijkstra':
+        optimal_routes = shortest_routes_dijkstra(adjacency, distances, stations)
+    elif route_engine == 'floyd_warshall':
+        optimal_routes = shortest_routes_floyd_warshall(adjacency, distances, stations)
+    elif route_engine == 'mip' and workers > 1:
+        # Split origin/destination pairs across processes, results come back in the order of all_routes
+        chunksize = max(1, len(all_routes) // (workers*4))
+        with ProcessPoolExecutor(workers, initializer=init_route_worker, initargs=(adjacency, distances, stations)) as executor:
+            optimal_routes = dict(zip(all_routes, executor.map(optimal_route_worker, all_routes, chunksize=chunksize)))
+    elif route_engine == 'mip':
+        optimal_routes = {}
+        for start_end in all_routes:
+            optimal_routes[start_end] = optimal_route_mip(start_end, adjacency, distances, stations)
+    else:
+        raise ValueError("Unknown route engine '{}'".format(route_engine))
     
+    unreachable = [start_end for start_end in all_routes if start_end not in optimal_routes]
+    if unreachable:
+        raise ValueError("No route between stations: {}".format(', '.join('{}-{}'.format(s1, s2) for s1, s2 in unreachable)))
     
     all_optimal_routes = {}              # Dict for recording all optimal routes key=(source,destination) Value =[route]
     for start_end in all_routes:
-        start = start_end[0]
-        end = start_end[1]
-
-        # Part B. Determine time required to travel between two stations
-        solver = pywraplp.Solver('LPWrapper', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
-        
-               
-        # Create decision variables for each connected pair of stations
-        station_pairs = {}
-        
-        # Part B (a). For each line, create a decision variable for stations connected
-        for l in lines:
-            for s1 in stations:
-                if str(stops.loc[s1,l]) == 'nan':
-                    continue
-                for s2 in stations:
-                    if str(stops.loc[s2,l]) == 'nan' or s1 == s2:
-                        continue
-                    if abs(stops.loc[s2,l] - stops.loc[s1,l]) == 1:
-                        station_pairs[l+'_'+s1+'_'+s2] = solver.IntVar(0, 1, l+'_'+s1+'_'+s2)
-                        # station_pair_line_list.append((l,s1,s2))
-                    else:
-                        if l in loop_lines:
-                            no_stops = stops[l].count()
-                            if (stops.loc[s1,l] == 1 and stops.loc[s2,l] == no_stops) or (stops.loc[s2,l] == 1 and stops.loc[s1,l] == no_stops):
-                                station_pairs[l+'_'+s1+'_'+s2] = solver.IntVar(0, 1, l+'_'+s1+'_'+s2)
-                                # station_pair_line_list.append((l,s1,s2))
-
-     
-        # Part B (b) (i). Implement constraints that origin is included in the path
-        constraint = solver.Constraint(1,1)
-        for pair in station_pairs:
-            s1, s2 = pair.split('_')[1], pair.split('_')[2]
-            if start == s1:
-                constraint.SetCoefficient(station_pairs[pair], 1)           
-        
-        # Part B (b) (ii). Implement constraints that final station is last stop
-        constraint = solver.Constraint(1,1)
-        for pair in station_pairs:
-            s1, s2 = pair.split('_')[1], pair.split('_')[2]
-            if end == s2:
-                constraint.SetCoefficient(station_pairs[pair], 1)
-    
-        # Part B (b) (ii). Implement constraints that there are no dead ends.
-        
-        # Ensure start and end are not visited more than once
-        constraint = solver.Constraint(0,0)
-        for pair in station_pairs:
-            s1, s2 = pair.split('_')[1], pair.split('_')[2]
-            if end == s1:
-                constraint.SetCoefficient(station_pairs[pair], 1)
-                
-        constraint = solver.Constraint(0,0)
-        for pair in station_pairs:
-            s1, s2 = pair.split('_')[1], pair.split('_')[2]
-            if start == s2:
-                constraint.SetCoefficient(station_pairs[pair], 1)
-        
-        
-        # Ensure all stations that are visited (excluding origin and destination) have two journey pairs (arriving and leaving) or not visited at all
-        for s in stations:
-            if s in start_end:
-                continue
-            constraint = solver.Constraint(0, 0)
-            for pair in station_pairs:
-                s1, s2 = pair.split('_')[1], pair.split('_')[2]
-                if s == s1 :
-                    constraint.SetCoefficient(station_pairs[pair], 1)
-                if s == s2 :
-                    constraint.SetCoefficient(station_pairs[pair], -1)
-        
-        # Part B (c). Minimize the overall travel time
-        distance = solver.Objective()
-    
-        for pair in station_pairs:
-            s1, s2 = pair.split('_')[1], pair.split('_')[2]
-            distance.SetCoefficient(station_pairs[pair], float(distances.loc[s1,s2]))
-        
-        distance.SetMinimization()
-        solver.Solve()
-        
-        total_distance = 0
-        for pair in station_pairs:
-            s1, s2 = pair.split('_')[1], pair.split('_')[2]
-            total_distance += station_pairs[pair].solution_value() * distances.loc[s1,s2]
-            
-        route = []
-        last_stop = start
-        # Obtain route from optimized result including lines
-        while not last_stop == end:                                            # Continue looping until we reach the last stop
-            for pair in station_pairs:
-                l, s1, s2 = pair.split('_')[0], pair.split('_')[1], pair.split('_')[2]
-                if s1 == last_stop:
-                    if station_pairs[pair].solution_value() > 0:
-                        pair_route = (s1,s2)
-                        route.append(pair_route)
-                        last_stop = s2
+        total_distance, route = optimal_routes[start_end]
                
         # with open('task3.txt', 'a') as f:
         print('Origin: {} Destination: {} Total Travel Time: {}'.format(start_end[0], start_end[1], total_distance))
@@ -661,7 +1651,8 @@ def task3(d):
     print('\t\t\tTask 3: Part C')
     print('-'*40+'\n')
     
-    solver = pywraplp.Solver('LPWrapper', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+    trace.phase('build')
+    solver = create_solver(backend, threads, time_limit, mip=True)
     
     # Part C (a). Create decision variables for number of trains on each line
     train_requirements = {}
@@ -673,27 +1664,34 @@ def task3(d):
     
     '''
     1. Compute all traffic between hops
-        for each hop
-            for each route check if hop takes place:
-                increment hop traffic by total passangers traversing route
+        route/hop incidence matrix (one entry for each hop on each route) x passengers on each route
     2. For each hop implement constraints that traffic is satisfied with enough trains
     '''        
     
-    hop_traffic = {}                                            # Dictionary of total traffic in any given hop
+    hop_index = {}
+    for i, sp in enumerate(station_pair_list):
+        hop_index[sp] = i
+    station_index = {}
+    for i, s in enumerate(stations):
+        station_index[s] = i
     
-    for sp in station_pair_list:                                # for each hop
-        total_traffic = 0
-        for k in all_optimal_routes:                            # For each route
-            if sp in all_optimal_routes[k]:
-                total_traffic += passengers.loc[k[0], k[1]]     # If hop takes place on route. Increment total passangers passing through
-        
-        hop_traffic[sp] = total_traffic       
+    # Incidence matrix in coordinate form: row = hop, column = (origin, destination) position in flattened passengers matrix
+    incidence_hops = []
+    incidence_routes = []
+    for k in all_optimal_routes:
+        for sp in all_optimal_routes[k]:
+            incidence_hops.append(hop_index[sp])
+            incidence_routes.append(station_index[k[0]]*len(stations) + station_index[k[1]])
+    
+    route_passengers = passengers.loc[stations, stations].to_numpy(dtype=float).ravel()
+    traffic = np.bincount(incidence_hops, weights=route_passengers[incidence_routes], minlength=len(station_pair_list))
+    hop_traffic = dict(zip(station_pair_list, traffic))         # Dictionary of total traffic in any given hop
 
     for hop in hop_traffic:
         constraint = solver.Constraint(hop_traffic[hop], solver.infinity())
         for l in lines:
             if l in pair_lines[hop]:
-                constraint.SetCoefficient(train_requirements[l], int(trains.loc['L1']))
+                constraint.SetCoefficient(train_requirements[l], int(trains.loc['L1'].iloc[0]))
                 
       
                 
@@ -703,24 +1701,43 @@ def task3(d):
         number_of_trains.SetCoefficient(train_requirements[l], 1)
     
     number_of_trains.SetMinimization()    
-    solver.Solve()
+    trace.model(solver)
+    trace.phase('solve')
+    status = solver.Solve()
+    trace.solver(solver, SOLVER_STATUS.get(status, status))
+    if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        print('No solution found: ', SOLVER_STATUS.get(status, status))
+        trace.end()
+        return status
     total_trains_required = 0
     for l in lines:
         total_trains_required += train_requirements[l].solution_value()
         print('Line: {} Trains Required: {}'.format(l, train_requirements[l].solution_value()))
 
     print('Total Trains Required: ', total_trains_required)
+    trace.end()
+    return status
 
     
         
 
+# Sheets each task reads from its input
+TASK_SHEETS = {'task1': ['Supplier stock', 'Raw material costs', 'Raw material shipping', 'Product requirements', 
+                         'Production capacity', 'Production cost', 'Customer demand', 'Shipping costs'],
+               'task2': ['Distances'],
+               'task3': ['Stops', 'Distances', 'Passengers', 'Trains']}
+
+
 def main():
     
-    task1_data = pd.read_excel('lp_1_data.xlsx', sheet_name = None, index_col=0)
-    task2_data = pd.read_excel('lp_2_data.xlsx', sheet_name = None, index_col=0)
-    task3_data = pd.read_excel('lp_3_data.xlsx', sheet_name = None, index_col=0)
+    trace = TaskTrace('lp_main')
+    trace.phase('load')
+    task1_data = read_sheets('lp_1_data.xlsx', TASK_SHEETS['task1'])
+    task2_data = read_sheets('lp_2_data.xlsx', TASK_SHEETS['task2'])
+    task3_data = read_sheets('lp_3_data.xlsx', TASK_SHEETS['task3'])
+    trace.end()
     
-    task1(task1_data) 
+    task1(task1_data, cache=ModelCache()) 
     task2(task2_data)
     task3(task3_data)
     
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of built models keyed by a fingerprint of the input data
+
+Each entry is the serialized model (CP-SAT CpModelProto text or LP MPModelProto), a JSON file with 
+whatever the task needs to use the model again (variable indices etc.) and the last solution, which 
+is used as a hint for the next solve. The least recently used entries are removed once the cache 
+is larger than max_bytes.
+
+    python model_cache.py info                  - list cached models
+    python model_cache.py invalidate [task]     - remove all cached models, or those of one task
+"""
+
+import os
+import sys
+import json
+import hashlib
+import pandas as pd
+import numpy as np
+
+CACHE_DIR = '.model_cache'
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+
+def frame_fingerprint(frames, *options):
+    """
+    Fingerprint of task input data
+
+    Parameters
+    ----------
+    frames : DICT or Pandas DF
+        Input sheets (sheet name -> Pandas DF) or a single Pandas DF.
+    *options : 
+        Any other task options the model depends on (must have a stable repr).
+
+    Returns
+    -------
+    STR
+        SHA-256 hex digest.
+
+    """
+    
+    if isinstance(frames, pd.DataFrame):
+        frames = {'': frames}
+    h = hashlib.sha256()
+    for name in sorted(frames):
+        df = frames[name]
+        h.update(repr((name, list(df.index), list(df.columns), [str(t) for t in df.dtypes])).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update(repr(options).encode('utf-8'))
+    return h.hexdigest()
+
+
+
+class ModelCache():
+    """
+    Built models on disk, keyed by task name and input fingerprint.
+
+    Parameters
+    ----------
+    directory : STR, optional
+        Cache directory. The default is CACHE_DIR.
+    max_bytes : INT, optional
+        Size above which least recently used entries are removed. The default is CACHE_MAX_BYTES.
+
+    """
+    
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory_ = directory
+        self.max_bytes_ = max_bytes
+    
+    
+    def paths(self, task, key):
+        base = os.path.join(self.directory_, task + '-' + key[:32])
+        return base + '.model', base + '.json'
+    
+    
+    def load(self, task, key):
+        """
+        Cached model of task for input fingerprint key.
+
+        Returns
+        -------
+        data : BYTES
+            Serialized model, None if not cached.
+        meta : DICT
+            Data stored with the model, 'solution' holds the last solution if one was stored.
+
+        """
+        
+        model_path, meta_path = self.paths(task, key)
+        try:
+            with open(model_path, 'rb') as f:
+                data = f.read()
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if meta.get('key') != key:
+            return None, None
+        
+        # Mark as recently used
+        os.utime(model_path)
+        os.utime(meta_path)
+        return data, meta
+    
+    
+    def store(self, task, key, data, meta):
+        """
+        Store serialized model and its data, then evict old entries if the cache is too large.
+        """
+        
+        os.makedirs(self.directory_, exist_ok=True)
+        model_path, meta_path = self.paths(task, key)
+        with open(model_path, 'wb') as f:
+            f.write(data)
+        meta = dict(meta, key=key, task=task)
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        self.evict()
+    
+    
+    def store_solution(self, task, key, solution):
+        """
+        Store solution (value of each variable, in model order) of a cached model.
+        """
+        
+        model_path, meta_path = self.paths(task, key)
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['solution'] = [v.item() if isinstance(v, np.generic) else v for v in solution]
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+    
+    
+    def entries(self):
+        """
+        Cached entries as (last used, bytes, base path), least recently used first.
+        """
+        
+        if not os.path.isdir(self.directory_):
+            return []
+        entries = {}
+        for name in os.listdir(self.directory_):
+            base, ext = os.path.splitext(name)
+            if ext not in ('.model', '.json'):
+                continue
+            path = os.path.join(self.directory_, name)
+            used, size = entries.get(base, (0, 0))
+            entries[base] = (max(used, os.path.getmtime(path)), size + os.path.getsize(path))
+        return sorted((used, size, os.path.join(self.directory_, base)) for base, (used, size) in entries.items())
+    
+    
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for used, size, base in entries)
+        for used, size, base in entries:
+            if total <= self.max_bytes_:
+                break
+            self.remove(base)
+            total -= size
+    
+    
+    def remove(self, base):
+        for ext in ('.model', '.json'):
+            if os.path.exists(base + ext):
+                os.remove(base + ext)
+    
+    
+    def invalidate(self, task=None):
+        """
+        Remove all cached models, or only those of task.
+
+        Returns
+        -------
+        INT
+            Number of entries removed.
+
+        """
+        
+        removed = 0
+        for used, size, base in self.entries():
+            if task is None or os.path.basename(base).rsplit('-', 1)[0] == task:
+                self.remove(base)
+                removed += 1
+        return removed
+
+
+
+def main(argv):
+    cache = ModelCache()
+    if len(argv) >= 1 and argv[0] == 'invalidate':
+        removed = cache.invalidate(argv[1] if len(argv) > 1 else None)
+        print('Removed {} cached models'.format(removed))
+    elif len(argv) >= 1 and argv[0] == 'info':
+        entries = cache.entries()
+        for used, size, base in entries:
+            print('{:<60} {:>12,} bytes'.format(os.path.basename(base), size))
+        print('{} cached models, {:,} bytes'.format(len(entries), sum(size for used, size, base in entries)))
+    else:
+        print(__doc__)
+
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])